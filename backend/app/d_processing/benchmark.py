@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy
+
+from .dclass import Metadata, SensorCalibration, SyntheticGaitConfig, PrecisionPolicy
+from .detect_act import ActivityType
+from .synthetic import write_recording, generate_recording
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('Benchmark')
+
+BENCHMARK_SIZES = {'1m': 60, '10m': 600, '1h': 3600, '8h': 8 * 3600}
+BENCHMARK_HISTORY = os.getenv("BENCHMARK_HISTORY", "storage/benchmarks/history.json")
+REGRESSION_THRESHOLD = 0.10
+MIN_COMPARABLE_TIME = 1e-3  # более короткие стадии тонут в шуме таймера
+DEVICE_ID = "synthetic"
+
+BENCHMARK_MIX = {
+    ActivityType.STANDING: 0.2,
+    ActivityType.WALKING: 0.6,
+    ActivityType.STAIRS: 0.1,
+    ActivityType.RUNNING: 0.1
+}
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max())
+    }
+
+
+def _write_identity_calibration(storage: str):
+    identity = SensorCalibration(
+        acc_bias=np.zeros(3, dtype=np.float32),
+        acc_scale=np.ones(3, dtype=np.float32),
+        gyro_bias=np.zeros(3, dtype=np.float32)
+    ).to_dict()
+    with open(os.path.join(storage, f"{DEVICE_ID}.json"), 'w') as f:
+        json.dump({'id': DEVICE_ID, 'sensor1': identity, 'sensor2': identity}, f)
+
+
+def _run_size(file_path: str, storage: str, repeats: int) -> Dict:
+    # Выполняется в отдельном процессе, чтобы ru_maxrss относился только к этому размеру
+    from .imu_calibration import Calibrator
+    from .raw_process import GaitAnalysisOrchestrator
+
+    metadata = Metadata(start_time=datetime(2026, 1, 1), height=175.0)
+    totals = []
+    stage_times = defaultdict(list)
+    result = None
+    n_samples = 0
+    for _ in range(repeats):
+        orchestrator = GaitAnalysisOrchestrator(calibrator=Calibrator(storage=storage))
+        start = time.perf_counter()
+        result, report = orchestrator.process_session(file_path, metadata, device_id=DEVICE_ID, return_report=True)
+        totals.append(time.perf_counter() - start)
+        if isinstance(result, str):
+            raise RuntimeError(result.strip())
+        n_samples = report.n_samples
+        for stage in report.stages:
+            stage_times[stage.name].append(stage.wall_time)
+
+    def timing(times: List[float]) -> Dict:
+        latency = _percentiles(times)
+        return {
+            'latency': latency,
+            'samples_per_second': n_samples / latency['p50'] if latency['p50'] > 0 else None
+        }
+
+    return {
+        'n_samples': n_samples,
+        'repeats': repeats,
+        'step_count': int(result['step_count']) if result else 0,
+        'pipeline': timing(totals),
+        'stages': {name: timing(times) for name, times in stage_times.items()},
+        # Linux отдаёт ru_maxrss в КиБ
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    }
+
+
+def run_benchmark(sizes: List[str], repeats: int = 3, seed: int = 0) -> Dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as storage:
+        _write_identity_calibration(storage)
+        for label in sizes:
+            duration = BENCHMARK_SIZES[label]
+            file_path = os.path.join(storage, f"{label}.bin")
+            write_recording(file_path, SyntheticGaitConfig(duration=duration, activity_mix=BENCHMARK_MIX, seed=seed))
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results[label] = executor.submit(_run_size, file_path, storage, repeats).result()
+            os.remove(file_path)
+            _log_result(label, results[label])
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'seed': seed,
+        'results': results
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _log_result(label: str, result: Dict):
+    pipeline = result['pipeline']
+    logger.info(
+        f"{label}: {result['n_samples']:,} samples, p50 {pipeline['latency']['p50']:.3f}s, "
+        f"p90 {pipeline['latency']['p90']:.3f}s, {pipeline['samples_per_second']:,.0f} samples/s, "
+        f"peak RSS {result['peak_rss'] / 2**20:.0f} MiB, {result['step_count']} steps"
+    )
+    for name, stage in result['stages'].items():
+        throughput = stage['samples_per_second']
+        logger.info(
+            f"    {name:<20} p50 {stage['latency']['p50'] * 1e3:10.1f} ms"
+            + (f"  {throughput:14,.0f} samples/s" if throughput else "")
+        )
+
+
+def load_history(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_history(path: str, history: List[Dict]):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_baseline(history: List[Dict], run: Dict) -> Optional[Dict]:
+    # Сравнение имеет смысл только на той же машине
+    for previous in reversed(history):
+        if previous.get('host') == run['host']:
+            return previous
+    return None
+
+
+def compare_runs(run: Dict, baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    regressions = []
+
+    def check(name: str, current: Optional[float], previous: Optional[float], min_value: float = 0.0):
+        if current is None or previous is None or previous < min_value:
+            return
+        if current > previous * (1 + threshold):
+            regressions.append(f"{name}: {previous:.4g} -> {current:.4g} (+{(current / previous - 1) * 100:.1f}%)")
+
+    for label, result in run['results'].items():
+        base = baseline['results'].get(label)
+        if base is None:
+            continue
+        check(f"{label} pipeline p50", result['pipeline']['latency']['p50'], base['pipeline']['latency']['p50'], MIN_COMPARABLE_TIME)
+        for name, stage in result['stages'].items():
+            base_stage = base['stages'].get(name)
+            if base_stage is not None:
+                check(f"{label} {name} p50", stage['latency']['p50'], base_stage['latency']['p50'], MIN_COMPARABLE_TIME)
+        check(f"{label} peak RSS", result['peak_rss'], base['peak_rss'])
+    return regressions
+
+
+def check_precision(duration: float = 600, seed: int = 0, rtol: float = 1e-2, atol: float = 0.02) -> List[str]:
+    # Сводка округлена до сотых, поэтому кроме относительного допуска нужен абсолютный
+    from .imu_calibration import Calibrator
+    from .raw_process import GaitAnalysisOrchestrator
+
+    summaries = {}
+    with tempfile.TemporaryDirectory() as storage:
+        _write_identity_calibration(storage)
+        file_path = os.path.join(storage, "precision.bin")
+        write_recording(file_path, SyntheticGaitConfig(duration=duration, activity_mix=BENCHMARK_MIX, seed=seed))
+        metadata = Metadata(start_time=datetime(2026, 1, 1), height=175.0)
+        for policy in ('float64', 'float32'):
+            orchestrator = GaitAnalysisOrchestrator(
+                calibrator=Calibrator(storage=storage), precision=PrecisionPolicy(signal=policy)
+            )
+            summaries[policy] = orchestrator.process_session(file_path, metadata, device_id=DEVICE_ID)
+            if not isinstance(summaries[policy], dict):
+                return [f"{policy} run failed: {summaries[policy]}"]
+
+    reference, candidate = summaries['float64'], summaries['float32']
+    mismatches = []
+    for name, expected in reference.items():
+        actual = candidate.get(name)
+        if isinstance(expected, bool) or not isinstance(expected, (int, float)) or actual is None:
+            continue
+        if not np.isclose(actual, expected, rtol=rtol, atol=atol):
+            mismatches.append(f"{name}: float64 {expected} vs float32 {actual}")
+    return mismatches
+
+
+def check_live_chunking(
+    duration: float = 120, seed: int = 0, chunk_durations: tuple = (0.3, 1.0, 10.0, 60.0, None)
+) -> List[str]:
+    # Live-обработка должна находить одни и те же циклы при любом размере чанков; None — запись одним чанком
+    from .imu_calibration import Calibrator
+    from .live_process import IncrementalGaitProcessor
+
+    data, _ = generate_recording(SyntheticGaitConfig(duration=duration, activity_mix=BENCHMARK_MIX, seed=seed))
+    metadata = Metadata(start_time=datetime(2026, 1, 1), height=175.0)
+    events = {}
+    with tempfile.TemporaryDirectory() as storage:
+        _write_identity_calibration(storage)
+        for chunk_duration in chunk_durations:
+            processor = IncrementalGaitProcessor(
+                metadata, device_id=DEVICE_ID, calibrator=Calibrator(storage=storage)
+            )
+            step = len(data) if chunk_duration is None else max(int(chunk_duration * processor.sampling_rate), 1)
+            cycles = []
+            for start in range(0, len(data), step):
+                cycles.extend(processor.push(data[start:start + step]).cycles)
+            cycles.extend(processor.finish().cycles)
+            label = 'single chunk' if chunk_duration is None else f"{chunk_duration:g}s chunks"
+            events[label] = [(c.hs_idx, c.to_idx, c.next_hs_idx) for c in cycles]
+
+    (reference_label, reference), *others = events.items()
+    mismatches = []
+    for label, found in others:
+        if found != reference:
+            mismatches.append(f"{label}: {len(found)} cycles vs {len(reference)} with {reference_label}")
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the d_processing pipeline on synthetic recordings")
+    parser.add_argument('--sizes', nargs='+', choices=list(BENCHMARK_SIZES), default=list(BENCHMARK_SIZES))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=BENCHMARK_HISTORY)
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--no-save', action='store_true', help="do not append this run to the history file")
+    parser.add_argument('--check-precision', action='store_true', help="compare float32 and float64 summaries instead of timing")
+    parser.add_argument('--check-live', action='store_true', help="check that live cycles do not depend on chunk size")
+    args = parser.parse_args(argv)
+
+    if args.check_live:
+        mismatches = check_live_chunking(seed=args.seed)
+        for m in mismatches:
+            logger.warning(f"Live chunking mismatch: {m}")
+        if not mismatches:
+            logger.info("live cycles are identical for all chunk sizes")
+        return 1 if mismatches else 0
+
+    if args.check_precision:
+        mismatches = check_precision(seed=args.seed)
+        for m in mismatches:
+            logger.warning(f"Precision mismatch: {m}")
+        if not mismatches:
+            logger.info("float32 summary matches float64 within tolerance")
+        return 1 if mismatches else 0
+
+    run = run_benchmark(args.sizes, repeats=args.repeats, seed=args.seed)
+    history = load_history(args.history)
+    baseline = find_baseline(history, run)
+
+    regressions = []
+    if baseline is None:
+        logger.info("No baseline for this host yet")
+    else:
+        regressions = compare_runs(run, baseline, args.threshold)
+        for r in regressions:
+            logger.warning(f"Regression vs {baseline.get('commit') or baseline['timestamp']}: {r}")
+        if not regressions:
+            logger.info(f"No regressions beyond {args.threshold:.0%} vs {baseline.get('commit') or baseline['timestamp']}")
+
+    if not args.no_save:
+        history.append(run)
+        save_history(args.history, history)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import os
+import enum
+import json
+import pickle
+import hashlib
+import logging
+import dataclasses
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .dclass import Metadata
+
+logger = logging.getLogger('ProcessingCache')
+
+# Увеличивать при любом изменении алгоритмов, влияющем на результат:
+# старые записи кэша тогда просто перестанут совпадать
+CACHE_VERSION = 3
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "storage/result_cache")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 512 * 2**20))
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "storage/artifact_cache")
+# Артефакты занимают в несколько раз больше исходной записи, поэтому кэш включается явно
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", 0))
+
+HASH_BLOCK_SIZE = 4 * 2**20
+
+
+def _canonical(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: _canonical(getattr(obj, f.name)) for f in dataclasses.fields(obj)}
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, dict):
+        return {str(_canonical(k)): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj
+
+
+def fingerprint(*parts: Any) -> str:
+    payload = json.dumps([_canonical(p) for p in parts], sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def hash_raw(raw_data) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(raw_data, np.ndarray):
+        h.update(np.ascontiguousarray(raw_data).view(np.uint8))
+    elif isinstance(raw_data, (str, os.PathLike)):
+        with open(raw_data, 'rb') as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                h.update(block)
+    else:
+        h.update(memoryview(raw_data).cast('B'))
+    return h.hexdigest()
+
+
+@dataclasses.dataclass
+class CachedResult:
+    summary: Dict[str, Any]
+    step_metrics: List[Dict[str, Any]]
+    start_time: datetime
+
+    def bind(self, metadata: Metadata) -> 'CachedResult':
+        # Результат хранится вместе с метаданными сессии, для которой он посчитан;
+        # время и поля пользователя переносятся на текущую сессию
+        shift = metadata.start_time - self.start_time
+
+        def moved(value: str) -> str:
+            return (datetime.fromisoformat(value) + shift).isoformat()
+
+        summary = dict(self.summary)
+        for name in ('start_time', 'end_time'):
+            if summary.get(name):
+                summary[name] = moved(summary[name])
+        summary.update(
+            user_notes=metadata.user_notes,
+            is_baseline=metadata.is_baseline,
+            user_id=metadata.user_id
+        )
+
+        step_metrics = []
+        for m in self.step_metrics:
+            m = dict(m)
+            if m.get('timestamp'):
+                m['timestamp'] = moved(m['timestamp'])
+            m['session_id'] = metadata.session_id
+            step_metrics.append(m)
+        return CachedResult(summary=summary, step_metrics=step_metrics, start_time=metadata.start_time)
+
+
+class _DiskLRU:
+    # mtime файла служит отметкой последнего обращения
+    suffixes = ('.pkl',)
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _write_atomic(self, path: str, write):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.is_file() and e.name.endswith(self.suffixes):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ResultCache(_DiskLRU):
+    def __init__(self, directory: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        super().__init__(directory, max_bytes)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self._remove(path)
+            return None
+
+    def put(self, key: str, entry: CachedResult):
+        self._write_atomic(self._path(key), lambda f: pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+
+class ArtifactCache(_DiskLRU):
+    # Промежуточные результаты стадий: массивы хранятся в .npy и открываются через memmap,
+    # остальное (сегменты активности) — pickle
+    suffixes = ('.npy', '.pkl')
+
+    def __init__(self, directory: str = ARTIFACT_CACHE_DIR, max_bytes: int = ARTIFACT_CACHE_MAX_BYTES):
+        super().__init__(directory, max_bytes)
+
+    def _path(self, key: str, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}.{name}{suffix}")
+
+    def _existing(self, key: str, name: str) -> Optional[str]:
+        for suffix in self.suffixes:
+            path = self._path(key, name, suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def has(self, key: str, names: List[str]) -> bool:
+        return all(self._existing(key, name) is not None for name in names)
+
+    def load(self, key: str, name: str) -> Any:
+        path = self._existing(key, name)
+        if path is None:
+            raise KeyError(f"{key}.{name}")
+        os.utime(path)
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r')
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, key: str, name: str, value: Any):
+        if isinstance(value, np.ndarray):
+            self._write_atomic(self._path(key, name, '.npy'), lambda f: np.save(f, value))
+        else:
+            self._write_atomic(
+                self._path(key, name, '.pkl'), lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+        self.evict()
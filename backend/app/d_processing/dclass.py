@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 import datetime
 import numpy as np
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from app.data.tables import ActivityType
 
 @dataclass
@@ -21,6 +21,10 @@ class SensorCalibration:
     gyro_bias: np.ndarray 
     gyro_scale: np.ndarray = None
     rotation_matrix: Optional[np.ndarray] = None 
+
+    def __post_init__(self):
+        if self.gyro_scale is None:
+            self.gyro_scale = np.ones(3, dtype=np.float32)
     
     def to_dict(self) -> dict:
         return {
@@ -32,7 +36,7 @@ class SensorCalibration:
     
     @classmethod
     def from_dict(cls, data: dict) -> 'SensorCalibration':
-        rotation = np.array(data['rotation_matrix']) if data.get('rotation_matrix') is not None else None
+        rotation = np.array(data['rotation_matrix'], dtype=np.float32) if data.get('rotation_matrix') is not None else None
         return cls(
             acc_bias=np.array(data['acc_bias'], dtype=np.float32),
             acc_scale=np.array(data['acc_scale'], dtype=np.float32),
@@ -40,6 +44,21 @@ class SensorCalibration:
             rotation_matrix=rotation
         )
 
+@dataclass
+class PrecisionPolicy:
+    # Сигналы датчиков и всё, что из них получено, хранятся в signal;
+    # integration — только для интегрирования кватернионов
+    signal: str = 'float32'
+    integration: str = 'float64'
+
+    @property
+    def signal_dtype(self) -> np.dtype:
+        return np.dtype(self.signal)
+
+    @property
+    def integration_dtype(self) -> np.dtype:
+        return np.dtype(self.integration)
+
 @dataclass
 class StepEvent:
     hs_idx: int  
@@ -48,6 +67,16 @@ class StepEvent:
 
 @dataclass
 class GaitCycle:
+    hs_idx: int
+    to_idx: int
+    next_hs_idx: int
+    ms_idx: int
+    duration: float
+    stride_time: float
+    stance_time: float
+    swing_time: float
+    cadence: float
+
     def to_dict(self) -> Dict:
         return {
             'hs': self.hs_idx,
@@ -91,6 +120,13 @@ class FilterConfig:
     transition_duration: float = 0.5  
     transition_type: str = "cosine"  
     sampling_rate: int = 125 
+    # Фильтровать каждую активность только на её участках с запасом под переходные процессы,
+    # а не всю запись целиком
+    segment_local: bool = True
+    segment_padding: float = 2.0  # с
+    # Вход — калиброванный сигнал без префильтрации: префильтр входит в каскад каждой активности
+    fuse_prefilter: bool = False
+    prefilter_cutoff: float = 20.0
     
     def __post_init__(self):
         if self.cutoff_frequencies is None:
@@ -160,4 +196,94 @@ class ActivitySegment:
     start_time: float 
     end_time: float  
     confidence: float  
-    features: Optional[ActivityFeatures] = None
\ No newline at end of file
+    features: Optional[ActivityFeatures] = None
+
+@dataclass
+class LiveUpdate:
+    cycles: List[GaitCycle] = field(default_factory=list)
+    metrics: List[Dict] = field(default_factory=list)
+    segments: List[ActivitySegment] = field(default_factory=list)
+    current_segment: Optional[ActivitySegment] = None
+    samples_processed: int = 0
+
+@dataclass
+class StageMetrics:
+    name: str
+    n_samples: int
+    wall_time: float
+    cpu_time: float
+    samples_per_second: float
+    peak_memory: Optional[int] = None  # байты, если включён tracemalloc
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'n_samples': self.n_samples,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'samples_per_second': self.samples_per_second,
+            'peak_memory': self.peak_memory,
+            'error': self.error
+        }
+
+@dataclass
+class ProcessingReport:
+    session_id: Optional[int] = None
+    device_id: Optional[str] = None
+    n_samples: int = 0
+    stages: List[StageMetrics] = field(default_factory=list)
+
+    @property
+    def wall_time(self) -> float:
+        return sum(s.wall_time for s in self.stages)
+
+    @property
+    def cpu_time(self) -> float:
+        return sum(s.cpu_time for s in self.stages)
+
+    @property
+    def failed_stage(self) -> Optional[str]:
+        return next((s.name for s in self.stages if s.error is not None), None)
+
+    def to_dict(self) -> dict:
+        return {
+            'session_id': self.session_id,
+            'device_id': self.device_id,
+            'n_samples': self.n_samples,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'failed_stage': self.failed_stage,
+            'stages': [s.to_dict() for s in self.stages]
+        }
+
+@dataclass
+class SyntheticGaitConfig:
+    duration: float = 60.0  # с
+    sampling_rate: int = 125
+    cadence: float = 110.0  # шагов/мин при ходьбе
+    stance_ratio: float = 0.6
+    activity_mix: Dict[ActivityType, float] = field(
+        default_factory=lambda: {ActivityType.WALKING: 1.0}
+    )
+    bout_duration: float = 30.0  # средняя длина эпизода активности, с
+    initial_standing: float = 2.0  # для align_to_gravity
+    stride_cv: float = 0.02
+    acc_noise: float = 0.05  # м/с²
+    gyro_noise: float = 1.0  # град/с
+    gyro_bias: np.ndarray = field(default_factory=lambda: np.zeros(3, dtype=np.float32))
+    seed: int = 0
+
+    def __post_init__(self):
+        self.gyro_bias = np.broadcast_to(np.asarray(self.gyro_bias, dtype=np.float32), (3,)).copy()
+
+@dataclass
+class GaitGroundTruth:
+    hs_idx: np.ndarray
+    to_idx: np.ndarray
+    ms_idx: np.ndarray
+    next_hs_idx: np.ndarray
+    activities: List[ActivitySegment] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.hs_idx)
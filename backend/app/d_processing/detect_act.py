@@ -1,123 +1,121 @@
 import numpy as np
-from dataclasses import dataclass, asdict, is_dataclass
+from dataclasses import dataclass, asdict, is_dataclass, fields, replace
+from numpy.lib.stride_tricks import sliding_window_view
 from enum import Enum
 from typing import List, Tuple, Dict, Optional, Any
 from scipy import signal
 from datetime import datetime
+from app.data.tables import ActivityType
 from .dclass import ActivityFeatures, ActivitySegment, DetectionConfig
 
-class ActivityType(Enum):
-    STANDING = "standing"
-    WALKING = "walking"
-    RUNNING = "running"
-    JUMPING = "jumping"
-    STAIRS = "stairs"
-    UNKNOWN = "unknown"
+FEATURE_DTYPE = np.dtype([
+    (f.name, np.int64 if f.type is int else np.float64) for f in fields(ActivityFeatures)
+])
+ACTIVITY_TYPES = list(ActivityType)
+ACTIVITY_CODES = {a: i for i, a in enumerate(ACTIVITY_TYPES)}
+FEATURE_BLOCK = 4096  # окон за один батч FFT: ограничивает временные матрицы (окна × отсчёты)
 
 class ActivityDetector:
     def __init__(self, config: Optional[DetectionConfig] = None):
         self.config = config if config is not None else DetectionConfig()
+        self._spectral = {}
         
     def detect(self, data: np.ndarray) -> List[ActivitySegment]:
         window_samples = int(self.config.window_size * self.config.sampling_rate)
         step_samples = int((self.config.window_size - self.config.window_overlap) * 
                           self.config.sampling_rate)
         
-        segments = []
-        n_samples = len(data)
-        
-        for start_idx in range(0, n_samples - window_samples + 1, step_samples):
-            end_idx = start_idx + window_samples
-            window_data = data[start_idx:end_idx]
-            
-            features = self._extract_features(window_data)
-            
-            activity_type, confidence = self._classify(features)
-            
-            segment = ActivitySegment(
-                activity_type=activity_type,
-                start_time=window_data['timestamp'][0],
-                end_time=window_data['timestamp'][-1],
-                confidence=confidence,
-                features=features
-            )
-            segments.append(segment)
+        starts, features = self.extract_features(data, window_samples, step_samples)
+        labels, confidences = self.classify_features(features)
         
-        merged_segments = self._merge_segments(segments)
-        
-        return merged_segments
+        return self._merge_windows(labels, confidences, starts, features, np.asarray(data['timestamp']), window_samples)
+
+    def classify_window(self, window_data: np.ndarray) -> ActivitySegment:
+        features = self._extract_features(window_data)
+        activity_type, confidence = self._classify(features)
+        return ActivitySegment(
+            activity_type=activity_type,
+            start_time=window_data['timestamp'][0],
+            end_time=window_data['timestamp'][-1],
+            confidence=confidence,
+            features=features
+        )
     
     def _extract_features(self, window_data: np.ndarray) -> ActivityFeatures:
-        acc_thigh = window_data['acc1']
-        acc_shank = window_data['acc2']  
-        
-        mag_thigh = np.sqrt(np.sum(acc_thigh**2, axis=1))  
-        mag_shank = np.sqrt(np.sum(acc_shank**2, axis=1))  
-        
-        sma_thigh = np.mean(np.sum(np.abs(acc_thigh), axis=1))
-        sma_shank = np.mean(np.sum(np.abs(acc_shank), axis=1))
-        
-        mag_mean_thigh = np.mean(mag_thigh)
-        mag_mean_shank = np.mean(mag_shank)
-        mag_std_thigh = np.std(mag_thigh)
-        mag_std_shank = np.std(mag_shank)
-        
-        mag_ratio = mag_mean_shank / (mag_mean_thigh + 1e-6)
-        
-        window = np.hanning(len(mag_shank))
-        
-        fft_shank = np.fft.rfft(mag_shank * window)
-        freqs = np.fft.rfftfreq(len(mag_shank), 1.0 / self.config.sampling_rate)
+        _, features = self.extract_features(window_data, len(window_data), len(window_data))
+        return self._features_from_row(features[0])
+    
+    @staticmethod
+    def _features_from_row(row: np.void) -> ActivityFeatures:
+        return ActivityFeatures(**{name: row[name].item() for name in FEATURE_DTYPE.names})
+    
+    def _spectral_setup(self, window_samples: int):
+        # Окно Ханна и маска частотного диапазона зависят только от длины окна
+        setup = self._spectral.get(window_samples)
+        if setup is None:
+            freqs = np.fft.rfftfreq(window_samples, 1.0 / self.config.sampling_rate)
+            freq_mask = (freqs >= self.config.freq_band_low) & (freqs <= self.config.freq_band_high)
+            setup = (np.hanning(window_samples), freq_mask, freqs[freq_mask])
+            self._spectral[window_samples] = setup
+        return setup
+    
+    def extract_features(self, data: np.ndarray, window_samples: int, step_samples: int):
+        # Признаки всех окон сразу: окна — строки strided-представлений, результат — по столбцу на признак
+        n_samples = len(data)
+        if n_samples < window_samples:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=FEATURE_DTYPE)
+        starts = np.arange(0, n_samples - window_samples + 1, step_samples)
+        features = np.zeros(len(starts), dtype=FEATURE_DTYPE)
         
-        freq_mask = (freqs >= self.config.freq_band_low) & (freqs <= self.config.freq_band_high)
-        power_spectrum = np.abs(fft_shank[freq_mask])**2
-        freqs_filtered = freqs[freq_mask]
+        acc_thigh = data['acc1']
+        acc_shank = data['acc2']
+        mag_thigh = np.sqrt(np.sum(acc_thigh**2, axis=1))
+        mag_shank = np.sqrt(np.sum(acc_shank**2, axis=1))
         
-        spectral_energy_shank = np.sum(power_spectrum)
+        def windows(x: np.ndarray) -> np.ndarray:
+            return sliding_window_view(x, window_samples)[::step_samples]
         
-        if len(power_spectrum) > 0:
-            dominant_idx = np.argmax(power_spectrum)
-            dominant_freq_shank = freqs_filtered[dominant_idx]
-        else:
-            dominant_freq_shank = 0.0
+        features['sma_thigh'] = np.mean(windows(np.sum(np.abs(acc_thigh), axis=1)), axis=1)
+        features['sma_shank'] = np.mean(windows(np.sum(np.abs(acc_shank), axis=1)), axis=1)
         
-        cadence = dominant_freq_shank * 60 * 2
+        mag_mean_thigh = np.mean(windows(mag_thigh), axis=1)
+        mag_mean_shank = np.mean(windows(mag_shank), axis=1)
+        features['mag_mean_thigh'] = mag_mean_thigh
+        features['mag_mean_shank'] = mag_mean_shank
+        features['mag_std_thigh'] = np.std(windows(mag_thigh), axis=1)
+        features['mag_std_shank'] = np.std(windows(mag_shank), axis=1)
+        features['mag_ratio'] = mag_mean_shank / (mag_mean_thigh + 1e-6)
+        features['vertical_variance'] = np.var(windows(acc_shank[:, 2]), axis=1)
         
-        fft_thigh = np.fft.rfft(mag_thigh * window)
-        power_spectrum_thigh = np.abs(fft_thigh[freq_mask])**2
-        spectral_energy_thigh = np.sum(power_spectrum_thigh)
+        hann, freq_mask, freqs_filtered = self._spectral_setup(window_samples)
+        for block in range(0, len(starts), FEATURE_BLOCK):
+            rows = slice(block, block + FEATURE_BLOCK)
+            for name, mag in (('thigh', mag_thigh), ('shank', mag_shank)):
+                spectrum = np.fft.rfft(windows(mag)[rows] * hann, axis=1)
+                power_spectrum = np.abs(spectrum[:, freq_mask])**2
+                features[f'spectral_energy_{name}'][rows] = np.sum(power_spectrum, axis=1)
+                if len(freqs_filtered) > 0:
+                    features[f'dominant_freq_{name}'][rows] = freqs_filtered[np.argmax(power_spectrum, axis=1)]
+        features['cadence'] = features['dominant_freq_shank'] * 60 * 2
         
-        if len(power_spectrum_thigh) > 0:
-            dominant_idx_thigh = np.argmax(power_spectrum_thigh)
-            dominant_freq_thigh = freqs_filtered[dominant_idx_thigh]
-        else:
-            dominant_freq_thigh = 0.0
-        
-        peaks, _ = signal.find_peaks(
-            mag_shank,
-            height=self.config.jumping_peak_threshold * 9.81,  
-            distance=int(self.config.sampling_rate * 0.2) 
-        )
-        peak_count_shank = len(peaks)
-        
-        vertical_variance = np.var(acc_shank[:, 2])
-        
-        return ActivityFeatures(
-            sma_thigh=float(sma_thigh),
-            sma_shank=float(sma_shank),
-            mag_mean_thigh=float(mag_mean_thigh),
-            mag_mean_shank=float(mag_mean_shank),
-            mag_std_thigh=float(mag_std_thigh),
-            mag_std_shank=float(mag_std_shank),
-            mag_ratio=float(mag_ratio),
-            cadence=float(cadence),
-            spectral_energy_thigh=float(spectral_energy_thigh),
-            spectral_energy_shank=float(spectral_energy_shank),
-            dominant_freq_thigh=float(dominant_freq_thigh),
-            dominant_freq_shank=float(dominant_freq_shank),
-            peak_count_shank=int(peak_count_shank),
-            vertical_variance=float(vertical_variance)
-        )
+        features['peak_count_shank'] = self._count_peaks(mag_shank, starts, window_samples)
+        return starts, features
+    
+    def _count_peaks(self, mag_shank: np.ndarray, starts: np.ndarray, window_samples: int) -> np.ndarray:
+        # Пик внутри окна — это и пик всей записи, поэтому окна без кандидатов выше порога
+        # пропускаются, а точный find_peaks с ограничением по расстоянию зовётся только для остальных
+        height = self.config.jumping_peak_threshold * 9.81
+        distance = int(self.config.sampling_rate * 0.2)
+        candidates, _ = signal.find_peaks(mag_shank, height=height)
+        counts = np.zeros(len(starts), dtype=np.int64)
+        has_candidates = (
+            np.searchsorted(candidates, starts + window_samples - 1) - np.searchsorted(candidates, starts + 1)
+        ) > 0
+        for i in np.flatnonzero(has_candidates):
+            start = starts[i]
+            peaks, _ = signal.find_peaks(mag_shank[start:start + window_samples], height=height, distance=distance)
+            counts[i] = len(peaks)
+        return counts
     
     def _classify(self, features: ActivityFeatures) -> Tuple[ActivityType, float]:
         cfg = self.config
@@ -171,21 +169,83 @@ class ActivityDetector:
         
         return ActivityType.UNKNOWN, 0.3
     
-    def _merge_segments(self, segments: List[ActivitySegment]) -> List[ActivitySegment]:
-        if len(segments) == 0:
+    def classify_features(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Те же правила, что в _classify, но маской на все окна; порядок правил = приоритет np.select
+        cfg = self.config
+        f = features
+        rules = [
+            (ActivityType.JUMPING,
+             (f['peak_count_shank'] >= cfg.jumping_peak_count_min) &
+             (f['vertical_variance'] >= cfg.jumping_vertical_var_min) &
+             (f['mag_std_shank'] > cfg.standing_std_max * 3)),
+            (ActivityType.STANDING,
+             (f['sma_shank'] <= cfg.standing_sma_max) &
+             (f['mag_std_shank'] <= cfg.standing_std_max)),
+            (ActivityType.RUNNING,
+             (f['sma_shank'] >= cfg.running_sma_min) &
+             (f['cadence'] >= cfg.running_cadence_min) &
+             (f['spectral_energy_shank'] >= cfg.running_energy_min)),
+            (ActivityType.STAIRS,
+             (f['mag_ratio'] >= cfg.stairs_mag_ratio_min) &
+             (cfg.stairs_cadence_min <= f['cadence']) & (f['cadence'] <= cfg.stairs_cadence_max) &
+             (f['sma_shank'] >= cfg.stairs_sma_min)),
+            (ActivityType.WALKING,
+             (cfg.walking_sma_min <= f['sma_shank']) & (f['sma_shank'] <= cfg.walking_sma_max) &
+             (cfg.walking_cadence_min <= f['cadence']) & (f['cadence'] <= cfg.walking_cadence_max) &
+             (f['spectral_energy_shank'] < cfg.walking_energy_max))
+        ]
+        
+        cadence_center = (cfg.walking_cadence_min + cfg.walking_cadence_max) / 2
+        cadence_range = cfg.walking_cadence_max - cfg.walking_cadence_min
+        with np.errstate(divide='ignore', invalid='ignore'):
+            confidence_rules = [
+                np.minimum(f['vertical_variance'] / (cfg.jumping_vertical_var_min * 2), 1.0),
+                1.0 - (f['sma_shank'] / cfg.standing_sma_max),
+                np.minimum(
+                    (f['spectral_energy_shank'] / cfg.running_energy_min) * 0.5 +
+                    (f['cadence'] / (cfg.running_cadence_min * 1.5)) * 0.5,
+                    1.0
+                ),
+                np.minimum((f['mag_ratio'] - 1.0) * 0.5 + 0.5, 1.0),
+                np.maximum(0.5, 1.0 - np.abs(f['cadence'] - cadence_center) / cadence_range)
+            ]
+        
+        masks = [mask for _, mask in rules]
+        labels = np.select(masks, [ACTIVITY_CODES[a] for a, _ in rules], default=ACTIVITY_CODES[ActivityType.UNKNOWN])
+        confidences = np.select(masks, confidence_rules, default=0.3)
+        return labels, confidences
+    
+    def _merge_windows(
+        self,
+        labels: np.ndarray,
+        confidences: np.ndarray,
+        starts: np.ndarray,
+        features: np.ndarray,
+        timestamps: np.ndarray,
+        window_samples: int
+    ) -> List[ActivitySegment]:
+        # Соседние окна одной активности сливаются: границы серий — смены метки (RLE)
+        if len(labels) == 0:
             return []
         
-        merged = []
-        current = segments[0]
+        change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        run_starts = np.concatenate(([0], change)).tolist()
+        run_ends = np.concatenate((change, [len(labels)])).tolist()
+        confidence_list = confidences.tolist()
         
-        for next_segment in segments[1:]:
-            if current.activity_type == next_segment.activity_type:
-                current.end_time = next_segment.end_time
-                current.confidence = (current.confidence + next_segment.confidence) / 2
-            else:
-                merged.append(current)
-                current = next_segment
-        merged.append(current)
+        merged = []
+        for first, end in zip(run_starts, run_ends):
+            # Уверенность сворачивается последовательно, как при попарном слиянии окон
+            confidence = confidence_list[first]
+            for value in confidence_list[first + 1:end]:
+                confidence = (confidence + value) / 2
+            merged.append(ActivitySegment(
+                activity_type=ACTIVITY_TYPES[labels[first]],
+                start_time=timestamps[starts[first]],
+                end_time=timestamps[starts[end - 1] + window_samples - 1],
+                confidence=confidence,
+                features=self._features_from_row(features[first])
+            ))
         
         return merged
     
@@ -198,6 +258,151 @@ class ActivityDetector:
         
         return summary
 
+class StreamingActivityDetector:
+    # Потоковая детекция для live: признаки окна не считаются заново, а сдвигаются на hop отсчётов —
+    # скользящие суммы для SMA/среднего/дисперсии и скользящее ДПФ только по бинам полосы
+    # freq_band_low–freq_band_high. Стоимость на отсчёт — O(бинов) вместо FFT каждого окна
+    RESYNC_WINDOWS = 4096  # суммы периодически пересчитываются с нуля, чтобы не копилась ошибка округления
+
+    def __init__(self, config: Optional[DetectionConfig] = None):
+        self.detector = ActivityDetector(config)
+        self.config = self.detector.config
+        self.window_samples = int(self.config.window_size * self.config.sampling_rate)
+        self.hop_samples = int((self.config.window_size - self.config.window_overlap) *
+                               self.config.sampling_rate)
+        n, h = self.window_samples, self.hop_samples
+
+        _, freq_mask, self._freqs = self.detector._spectral_setup(n)
+        # Симметричное окно Ханна 0.5 - 0.5·cos(2πn/(N-1)) раскладывается на три экспоненты,
+        # поэтому спектр окна с весами — комбинация невзвешенных сумм на частотах ω и ω ± 2π/(N-1)
+        omega = 2 * np.pi * np.flatnonzero(freq_mask) / n
+        theta = 2 * np.pi / (n - 1)
+        self._omega = np.concatenate([omega, omega - theta, omega + theta])
+        lag = h - np.arange(h)
+        self._rotate = np.exp(1j * self._omega * h)
+        self._leave = np.exp(1j * np.outer(lag, self._omega))
+        self._enter = self._leave * np.exp(-1j * self._omega * n)
+        self._basis = np.exp(-1j * np.outer(np.arange(n), self._omega))
+        self.reset()
+
+    def reset(self):
+        # Столбцы: |acc| бедра и голени, модули ускорения, их квадраты, вертикальное ускорение голени и его квадрат
+        self._rows = np.zeros((0, 8))
+        self._timestamps = np.zeros(0)
+        self._sums = None
+        self._spectra = None
+        self._n_windows = 0
+        self.windows: List[ActivitySegment] = []
+        self.current_segment: Optional[ActivitySegment] = None
+
+    def push(self, data) -> List[ActivitySegment]:
+        # Возвращает завершённые сегменты; окна, классифицированные за этот вызов, — в self.windows
+        self.windows = []
+        completed = []
+        if len(data) == 0:
+            return completed
+        self._rows = np.concatenate([self._rows, self._sample_rows(data)])
+        self._timestamps = np.concatenate([self._timestamps, np.asarray(data['timestamp'], dtype=np.float64)])
+
+        while True:
+            if self._sums is None:
+                if len(self._rows) < self.window_samples:
+                    break
+                self._resync()
+            else:
+                if len(self._rows) < self.window_samples + self.hop_samples:
+                    break
+                self._slide()
+            window = self._classify_current()
+            self.windows.append(window)
+
+            current = self.current_segment
+            if current is not None and current.activity_type == window.activity_type:
+                current.end_time = window.end_time
+                current.confidence = (current.confidence + window.confidence) / 2
+            else:
+                if current is not None:
+                    completed.append(current)
+                self.current_segment = replace(window)
+        return completed
+
+    def finish(self) -> List[ActivitySegment]:
+        # Хвост короче окна не классифицируется, как и в пакетной детекции
+        segments = [self.current_segment] if self.current_segment is not None else []
+        self.reset()
+        return segments
+
+    @staticmethod
+    def _sample_rows(data) -> np.ndarray:
+        acc_thigh = data['acc1']
+        acc_shank = data['acc2']
+        rows = np.empty((len(data), 8))
+        rows[:, 0] = np.sum(np.abs(acc_thigh), axis=1)
+        rows[:, 1] = np.sum(np.abs(acc_shank), axis=1)
+        rows[:, 2] = np.sqrt(np.sum(acc_thigh**2, axis=1))
+        rows[:, 3] = np.sqrt(np.sum(acc_shank**2, axis=1))
+        rows[:, 4:6] = rows[:, 2:4]**2
+        rows[:, 6] = acc_shank[:, 2]
+        rows[:, 7] = rows[:, 6]**2
+        return rows
+
+    def _resync(self):
+        window = self._rows[:self.window_samples]
+        self._sums = window.sum(axis=0)
+        self._spectra = window[:, 2:4].T @ self._basis
+
+    def _slide(self):
+        # Окно сдвигается на hop: уходящие отсчёты вычитаются, входящие прибавляются
+        n, h = self.window_samples, self.hop_samples
+        leaving, entering = self._rows[:h], self._rows[n:n + h]
+        self._sums += entering.sum(axis=0) - leaving.sum(axis=0)
+        self._spectra = (
+            self._spectra * self._rotate + entering[:, 2:4].T @ self._enter - leaving[:, 2:4].T @ self._leave
+        )
+        self._rows = self._rows[h:]
+        self._timestamps = self._timestamps[h:]
+        self._n_windows += 1
+        if self._n_windows % self.RESYNC_WINDOWS == 0:
+            self._resync()
+
+    def _classify_current(self) -> ActivitySegment:
+        n = self.window_samples
+        mean = self._sums / n
+        features = np.zeros(1, dtype=FEATURE_DTYPE)
+        features['sma_thigh'] = mean[0]
+        features['sma_shank'] = mean[1]
+        features['mag_mean_thigh'] = mean[2]
+        features['mag_mean_shank'] = mean[3]
+        # Дисперсия как E[x²] - E[x]²; отрицательный остаток округления отсекается
+        features['mag_std_thigh'] = np.sqrt(max(mean[4] - mean[2]**2, 0.0))
+        features['mag_std_shank'] = np.sqrt(max(mean[5] - mean[3]**2, 0.0))
+        features['mag_ratio'] = mean[3] / (mean[2] + 1e-6)
+        features['vertical_variance'] = max(mean[7] - mean[6]**2, 0.0)
+
+        spectra = self._spectra.reshape(2, 3, -1)
+        power_spectrum = np.abs(0.5 * spectra[:, 0] - 0.25 * (spectra[:, 1] + spectra[:, 2]))**2
+        for i, name in enumerate(('thigh', 'shank')):
+            features[f'spectral_energy_{name}'] = np.sum(power_spectrum[i])
+            if len(self._freqs) > 0:
+                features[f'dominant_freq_{name}'] = self._freqs[np.argmax(power_spectrum[i])]
+        features['cadence'] = features['dominant_freq_shank'] * 60 * 2
+
+        # find_peaks только если внутри окна есть отсчёт выше порога
+        height = self.config.jumping_peak_threshold * 9.81
+        mag_shank = self._rows[:n, 3]
+        if n > 2 and mag_shank[1:-1].max() >= height:
+            peaks, _ = signal.find_peaks(mag_shank, height=height, distance=int(self.config.sampling_rate * 0.2))
+            features['peak_count_shank'] = len(peaks)
+
+        labels, confidences = self.detector.classify_features(features)
+        return ActivitySegment(
+            activity_type=ACTIVITY_TYPES[labels[0]],
+            start_time=self._timestamps[0],
+            end_time=self._timestamps[n - 1],
+            confidence=confidences[0].item(),
+            features=self.detector._features_from_row(features[0])
+        )
+
 def jsonb(segments: List[Any]) -> List[dict]:
     json_ready_list = []
     
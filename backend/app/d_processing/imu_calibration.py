@@ -1,4 +1,4 @@
-from .unpacking import unpack_bin
+from .unpacking import unpack_bin, ImuChannels
 import numpy as np
 import json
 from dataclasses import dataclass
@@ -119,35 +119,40 @@ class Calibrator:
         
         return R1, R2
     
-    def apply(self, data: np.ndarray) -> np.ndarray:
+    def apply(self, data, dtype=np.float32, out: Optional[ImuChannels] = None) -> ImuChannels:
         assert self.sensor1_cal is not None, "Калибровка не выполнена"
         assert self.sensor2_cal is not None, "Калибровка не выполнена"
         
-        calibrated = np.copy(data)
+        # data — запись IMU_DTYPE или ImuChannels; out может совпадать с data (калибровка на месте)
+        if out is None:
+            out = ImuChannels.empty(len(data), dtype)
+        if out is not data:
+            out.timestamp[...] = data['timestamp']
         
         def apply_sensor_calibration(
             acc: np.ndarray, 
             gyro: np.ndarray, 
             cal: SensorCalibration
         ) -> Tuple[np.ndarray, np.ndarray]:
-            acc_corrected = (acc - cal.acc_bias) / cal.acc_scale  
-            gyro_corrected = (gyro - cal.gyro_bias) / cal.gyro_scale
+            acc_corrected = (acc.astype(dtype, copy=False) - cal.acc_bias.astype(dtype)) / cal.acc_scale.astype(dtype)
+            gyro_corrected = (gyro.astype(dtype, copy=False) - cal.gyro_bias.astype(dtype)) / cal.gyro_scale.astype(dtype)
             
             if cal.rotation_matrix is not None:
-                acc_aligned = np.einsum('ij,nj->ni', cal.rotation_matrix, acc_corrected)
-                gyro_aligned = np.einsum('ij,nj->ni', cal.rotation_matrix, gyro_corrected)
-                return acc_aligned.astype(np.float32), gyro_aligned.astype(np.float32)
+                rotation = cal.rotation_matrix.astype(dtype)
+                acc_aligned = np.einsum('ij,nj->ni', rotation, acc_corrected)
+                gyro_aligned = np.einsum('ij,nj->ni', rotation, gyro_corrected)
+                return acc_aligned, gyro_aligned
             
             return acc_corrected, gyro_corrected
         
-        calibrated['acc1'], calibrated['gyro1'] = apply_sensor_calibration(
+        out['acc1'], out['gyro1'] = apply_sensor_calibration(
             data['acc1'], data['gyro1'], self.sensor1_cal
         )
-        calibrated['acc2'], calibrated['gyro2'] = apply_sensor_calibration(
+        out['acc2'], out['gyro2'] = apply_sensor_calibration(
             data['acc2'], data['gyro2'], self.sensor2_cal
         )
         
-        return calibrated
+        return out
     
     def save(self, device_id):
         assert self.sensor1_cal is not None, "Калибровка не выполнена"
@@ -0,0 +1,77 @@
+import time
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from .dclass import StageMetrics, ProcessingReport
+
+logger = logging.getLogger('Instrumentation')
+
+MetricsSink = Callable[[ProcessingReport], None]
+
+
+def log_sink(report: ProcessingReport):
+    for s in report.stages:
+        memory = f", peak {s.peak_memory / 2**20:.1f} MiB" if s.peak_memory is not None else ""
+        status = f" FAILED: {s.error}" if s.error else ""
+        logger.info(
+            f"[{report.device_id}] {s.name}: {s.wall_time * 1e3:.1f} ms wall, {s.cpu_time * 1e3:.1f} ms cpu, "
+            f"{s.samples_per_second:,.0f} samples/s{memory}{status}"
+        )
+
+
+class StageInstrumentation:
+    # trace_memory включает tracemalloc: numpy сообщает ему свои аллокации,
+    # но чисто питоновские циклы при этом заметно замедляются
+    def __init__(self, trace_memory: bool = False, sink: Optional[MetricsSink] = None):
+        self.trace_memory = trace_memory
+        self.sink = sink
+        self.report: Optional[ProcessingReport] = None
+        self._owns_tracing = False
+
+    def start(self, n_samples: int = 0, session_id: Optional[int] = None, device_id: Optional[str] = None) -> ProcessingReport:
+        self.report = ProcessingReport(session_id=session_id, device_id=device_id, n_samples=n_samples)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        return self.report
+
+    @contextmanager
+    def stage(self, name: str, n_samples: int):
+        if self.report is None:
+            self.start(n_samples)
+
+        if self.trace_memory:
+            base_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        # Стадия отдаёт свою запись: число отсчётов можно задать внутри блока, когда оно станет известно
+        metrics = StageMetrics(name=name, n_samples=n_samples, wall_time=0.0, cpu_time=0.0, samples_per_second=0.0)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield metrics
+        except Exception as e:
+            metrics.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            metrics.wall_time = time.perf_counter() - wall_start
+            metrics.cpu_time = time.process_time() - cpu_start
+            if metrics.wall_time > 0:
+                metrics.samples_per_second = metrics.n_samples / metrics.wall_time
+            metrics.peak_memory = tracemalloc.get_traced_memory()[1] - base_memory if self.trace_memory else None
+            self.report.stages.append(metrics)
+
+    def finish(self) -> ProcessingReport:
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+        report, self.report = self.report, None
+        if report is not None and self.sink is not None:
+            try:
+                self.sink(report)
+            except Exception as e:
+                # Сбой отправки метрик не должен ронять обработку сессии
+                logger.warning(f"Metrics sink failed: {e}")
+        return report
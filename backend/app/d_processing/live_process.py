@@ -0,0 +1,259 @@
+import numpy as np
+import dataclasses
+from datetime import timedelta
+from typing import Optional, List
+from scipy import signal
+
+from .imu_calibration import Calibrator
+from .lowp_f import Filter, cascade_sos, clamp_prefilter_cutoff, PREFILTER_ORDER
+from .madgwick import MadgwickAHRS
+from .step_detection import StepDetector, gait_cycles
+from .quaternion import QuaternionArray
+from .detect_act import ActivityDetector, StreamingActivityDetector, ActivityType
+from .step_pro import calculate_step_metrics
+from .raw_process import orientation_angles, ORIENTATION_DTYPE
+from .unpacking import ImuChannels
+from .dclass import Metadata, LiveUpdate
+
+
+class CausalSOSFilter:
+    # Каузальный фильтр: состояние zi переносится между чанками
+    def __init__(self, sos: np.ndarray):
+        # Таблица cascade_sos общая и только для чтения, а sosfilt требует записываемый буфер
+        self.sos = np.array(sos)
+        self.zi = None
+        self.last_input = None
+
+    def switch(self, sos: np.ndarray):
+        # Новый фильтр стартует из установившегося состояния по последнему отсчёту,
+        # чтобы при смене активности не было переходного процесса
+        self.sos = np.array(sos)
+        self.zi = None
+        if self.last_input is not None:
+            self._init_state(self.last_input)
+
+    def _init_state(self, sample: np.ndarray):
+        self.zi = signal.sosfilt_zi(self.sos)[:, :, np.newaxis] * sample[np.newaxis, np.newaxis, :]
+
+    def __call__(self, channels: np.ndarray) -> np.ndarray:
+        if len(channels) == 0:
+            return channels
+        if self.zi is None:
+            self._init_state(channels[0])
+        out, self.zi = signal.sosfilt(self.sos, channels, axis=0, zi=self.zi)
+        self.last_input = channels[-1].copy()
+        return out
+
+
+class IncrementalGaitProcessor:
+    def __init__(
+        self,
+        metadata: Metadata,
+        device_id: str = "unknown_device",
+        calibrator: Optional[Calibrator] = None,
+        activity_detector: Optional[ActivityDetector] = None,
+        filter: Optional[Filter] = None,
+        event_detector: Optional[StepDetector] = None,
+        sampling_rate: int = 125,
+        prefilter_cutoff: float = 20.0,
+        lookback: float = 10.0,
+        align_duration: float = 1.5,
+        emit_interval: float = 1.0
+    ):
+        self.metadata = metadata
+        self.calibrator = calibrator if calibrator is not None else Calibrator()
+        self.activity_detector = activity_detector if activity_detector is not None else ActivityDetector()
+        self.filter = filter if filter is not None else Filter()
+        self.event_detector = event_detector if event_detector is not None else StepDetector()
+        self.sampling_rate = sampling_rate
+        self.dt = 1.0 / sampling_rate
+
+        self.calibrator.load(device_id)
+        self.align_samples = int(align_duration * sampling_rate)
+        self.lookback_samples = int(lookback * sampling_rate)
+        self.emit_samples = max(int(emit_interval * sampling_rate), 1)
+
+        cfg = self.event_detector.config
+        # Цикл считается завершённым, когда после next_hs есть запас на поиск HS/TO и следующий пик
+        self.finalize_margin = int((cfg.hs_search_window + cfg.to_search_window) * sampling_rate) + cfg.ms_peak_distance
+        self.min_hs_gap = cfg.ms_peak_distance // 2
+        # Невыданный цикл заканчивается после limit, значит его HS (и породивший его MS) не раньше
+        # чем за max_step_duration + hs_search_window до limit — этот хвост буфер хранит всегда
+        self.retain_samples = max(
+            self.lookback_samples,
+            self.finalize_margin + int((cfg.max_step_duration + cfg.hs_search_window) * sampling_rate)
+        )
+
+        self.prefilter = CausalSOSFilter(
+            cascade_sos((clamp_prefilter_cutoff(prefilter_cutoff, sampling_rate),), PREFILTER_ORDER, sampling_rate)
+        )
+        self.activity = ActivityType.UNKNOWN
+        self.adaptive_filter = CausalSOSFilter(self._activity_sos(self.activity))
+
+        self.madgwick_thigh = MadgwickAHRS(sampleperiod=self.dt, beta=0.1)
+        self.madgwick_shank = MadgwickAHRS(sampleperiod=self.dt, beta=0.1)
+
+        self.samples_seen = 0
+        self.step_count = 0
+        self._warmup: List[np.ndarray] = []
+        self._aligned = False
+
+        # Окна детекции активности: признаки сдвигаются вместе с окном, без FFT на каждое
+        self.activity_stream = StreamingActivityDetector(self.activity_detector.config)
+
+        # Look-back буфер для детекции шагов
+        self._offset = 0
+        self._filtered_buffer = None
+        self._orient_buffer = np.zeros(0, dtype=ORIENTATION_DTYPE)
+        self._acc_vertical_buffer = np.zeros(0)
+        self._sag_idx = None
+        self._last_hs = None
+
+    def _activity_sos(self, activity_type: ActivityType) -> np.ndarray:
+        return self.filter.get_sos(self.filter.config.cutoff_frequencies[activity_type])
+
+    def push(self, chunk: np.ndarray) -> LiveUpdate:
+        update = LiveUpdate()
+        if len(chunk) == 0:
+            return update
+
+        if not self._aligned:
+            self._warmup.append(chunk)
+            if sum(len(c) for c in self._warmup) < self.align_samples:
+                return update
+            chunk = self._finish_warmup()
+
+        return self._process(chunk, update)
+
+    def finish(self) -> LiveUpdate:
+        update = LiveUpdate()
+        if not self._aligned and self._warmup:
+            self._process(self._finish_warmup(), update, final=True)
+        elif self._filtered_buffer is not None:
+            self._emit_cycles(update, final=True)
+
+        update.segments.extend(self.activity_stream.finish())
+        update.current_segment = None
+        return update
+
+    def _finish_warmup(self) -> np.ndarray:
+        chunk = np.concatenate(self._warmup)
+        self._warmup = []
+        self.calibrator.align_to_gravity(chunk)
+        self._aligned = True
+        return chunk
+
+    def _process(self, chunk: np.ndarray, update: LiveUpdate, final: bool = False) -> LiveUpdate:
+        calibrated = self.calibrator.apply(chunk)
+        # Каузальные фильтры держат состояние в float64; буферы остаются во float32, как и в пакетной обработке
+        prefiltered_channels = self.prefilter(calibrated.signals.astype(np.float64))
+        prefiltered = ImuChannels(prefiltered_channels.astype(np.float32), calibrated.timestamp)
+
+        # Чанк режется по абсолютным позициям потока: концам окон активности и границам emit_samples.
+        # Смена фильтра, выдача циклов и обрезка буфера идут в одних и тех же точках,
+        # поэтому результат не зависит от того, какими чанками пришли данные
+        start = 0
+        while start < len(chunk):
+            stop = min(len(chunk), start + self._samples_to_boundary())
+            self._classify_windows(prefiltered[start:stop], update)
+            self._append_orientation(ImuChannels(
+                self.adaptive_filter(prefiltered_channels[start:stop]).astype(np.float32),
+                calibrated.timestamp[start:stop]
+            ))
+            self.samples_seen += stop - start
+            if self.samples_seen % self.emit_samples == 0:
+                self._emit_cycles(update)
+                self._trim_lookback()
+            start = stop
+
+        if final:
+            self._emit_cycles(update, final=True)
+        update.samples_processed = len(chunk)
+        update.current_segment = self.activity_stream.current_segment
+        return update
+
+    def _samples_to_boundary(self) -> int:
+        to_emit = self.emit_samples - self.samples_seen % self.emit_samples
+        window, hop = self.activity_stream.window_samples, self.activity_stream.hop_samples
+        if self.samples_seen < window:
+            to_window = window - self.samples_seen
+        else:
+            to_window = hop - (self.samples_seen - window) % hop
+        return min(to_emit, to_window)
+
+    def _classify_windows(self, prefiltered: ImuChannels, update: LiveUpdate):
+        update.segments.extend(self.activity_stream.push(prefiltered))
+        for window in self.activity_stream.windows:
+            if window.activity_type != self.activity:
+                self.activity = window.activity_type
+                self.adaptive_filter.switch(self._activity_sos(self.activity))
+
+    def _append_orientation(self, filtered: ImuChannels):
+        q_thigh = QuaternionArray(
+            self.madgwick_thigh.update_imu_batch(np.deg2rad(filtered['gyro1']), filtered['acc1'])
+        )
+        q_shank = QuaternionArray(
+            self.madgwick_shank.update_imu_batch(np.deg2rad(filtered['gyro2']), filtered['acc2'])
+        )
+        orientations, acc_vertical = orientation_angles(q_thigh, q_shank, filtered['acc2'])
+
+        if self._filtered_buffer is None:
+            self._filtered_buffer = filtered
+        else:
+            self._filtered_buffer = ImuChannels.concatenate([self._filtered_buffer, filtered])
+        self._orient_buffer = np.concatenate([self._orient_buffer, orientations])
+        self._acc_vertical_buffer = np.concatenate([self._acc_vertical_buffer, acc_vertical])
+
+    def _trim_lookback(self):
+        # Буфер обрезается только после _emit_cycles: иначе циклы из головы большого чанка
+        # и удержанные в finalize_margin на прошлом вызове терялись бы
+        drop = len(self._filtered_buffer) - self.retain_samples
+        if drop > 0:
+            self._filtered_buffer = self._filtered_buffer[drop:]
+            self._orient_buffer = self._orient_buffer[drop:]
+            self._acc_vertical_buffer = self._acc_vertical_buffer[drop:]
+            self._offset += drop
+
+    def _emit_cycles(self, update: LiveUpdate, final: bool = False):
+        buffer_len = len(self._filtered_buffer)
+        gyro_shank = self._filtered_buffer['gyro2']
+        if self._sag_idx is None or buffer_len < self.lookback_samples:
+            sag_idx = int(np.argmax(np.std(gyro_shank, axis=0)))
+            # Сагиттальная ось фиксируется, когда look-back буфер заполнен
+            if buffer_len >= self.lookback_samples:
+                self._sag_idx = sag_idx
+        else:
+            sag_idx = self._sag_idx
+
+        cycles = self.event_detector.detect_cycles(
+            gyro_shank[:, sag_idx], self._acc_vertical_buffer, self._filtered_buffer['timestamp']
+        )
+        limit = buffer_len if final else buffer_len - self.finalize_margin
+        is_ready = cycles['next_hs_idx'] <= limit
+        if self._last_hs is not None:
+            is_ready &= cycles['hs_idx'] + self._offset > self._last_hs + self.min_hs_gap
+        ready = cycles[is_ready]
+        if len(ready) == 0:
+            return
+
+        offset = self._offset
+        shifted_metadata = dataclasses.replace(
+            self.metadata,
+            start_time=self.metadata.start_time + timedelta(seconds=offset / self.sampling_rate)
+        )
+        metrics = calculate_step_metrics(
+            self._filtered_buffer, self._orient_buffer, ready,
+            fs=self.sampling_rate, metadata=shifted_metadata
+        )
+        for m in metrics:
+            self.step_count += 1
+            m['hs_idx'] = int(m['hs_idx']) + offset
+            m['next_hs_idx'] = int(m['next_hs_idx']) + offset
+            m['step_number'] = self.step_count
+
+        shifted = ready.copy()
+        for name in ('hs_idx', 'to_idx', 'next_hs_idx', 'ms_idx'):
+            shifted[name] += offset
+        update.cycles.extend(gait_cycles(shifted))
+        update.metrics.extend(metrics)
+        self._last_hs = int(shifted['hs_idx'][-1])
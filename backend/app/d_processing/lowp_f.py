@@ -1,140 +1,198 @@
 import numpy as np
-from scipy.signal import butter, filtfilt
-from typing import Dict, List, Optional
+from scipy.signal import butter
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from scipy import signal
 from enum import Enum
 from .detect_act import ActivityType
 from .dclass import ActivitySegment, FilterConfig
+from .workspace import Workspace
+from .unpacking import ImuChannels
 
-def prefiltration(data: np.ndarray, cutoff: float = 20.0, fs: float = 125.0): 
-    order = 4  
+PREFILTER_CUTOFF = 20.0
+PREFILTER_ORDER = 4
+
+# Коэффициенты общие для всего процесса: ключ — (частоты среза каскада, порядки, fs)
+_SOS_TABLE: Dict[tuple, np.ndarray] = {}
+
+def cascade_sos(cutoffs: Tuple[float, ...], order, fs: float) -> np.ndarray:
+    # Каскад НЧ-фильтров Баттерворта одной матрицей SOS: секции просто идут подряд,
+    # и один проход sosfiltfilt заменяет последовательные проходы каждым фильтром
+    cutoffs = tuple(float(c) for c in cutoffs)
+    orders = tuple(order) if isinstance(order, (tuple, list)) else (order,) * len(cutoffs)
+    key = (cutoffs, orders, float(fs))
+    sos = _SOS_TABLE.get(key)
+    if sos is None:
+        sos = np.vstack([
+            butter(n, c / (0.5 * fs), btype='lowpass', output='sos') for c, n in zip(cutoffs, orders)
+        ])
+        sos.flags.writeable = False
+        _SOS_TABLE[key] = sos
+    return sos
+
+def clamp_prefilter_cutoff(cutoff: float, fs: float) -> float:
     nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    if normal_cutoff >= 1.0:
-            normal_cutoff = 0.99
-    b, a = butter(order, normal_cutoff, btype='lowpass')
-    return filtfilt(b, a, data, axis=0)
+    return cutoff if cutoff < nyq else 0.99 * nyq
+
+def prefiltration(data, cutoff: float = PREFILTER_CUTOFF, fs: float = 125.0, dtype=np.float32, out: Optional[ImuChannels] = None):
+    # SOS остаётся устойчивым и в float32, в отличие от формы (b, a)
+    sos = cascade_sos((clamp_prefilter_cutoff(cutoff, fs),), PREFILTER_ORDER, fs).astype(dtype)
+    if not isinstance(data, ImuChannels):
+        if data.dtype.names is None:
+            return signal.sosfiltfilt(sos, data.astype(dtype, copy=False), axis=0)
+        data = ImuChannels.from_records(data, dtype)
+
+    # Фильтруются только каналы датчиков, одним вызовом по матрице (N, 12).
+    # out может совпадать с data — тогда результат пишется поверх входа
+    filtered = signal.sosfiltfilt(sos, data.signals.astype(dtype, copy=False), axis=0)
+    if out is None:
+        return ImuChannels(filtered, data.timestamp)
+    out.signals[...] = filtered
+    if out is not data:
+        out.timestamp[...] = data.timestamp
+    return out
 
 class Filter:
     def __init__(self, config: Optional[FilterConfig] = None):
         self.config = config if config is not None else FilterConfig()
-        self._filter_cache = {}  
         
     def process(
         self, 
-        data: np.ndarray, 
-        segments: List[ActivitySegment]
-    ) -> np.ndarray:
+        data, 
+        segments: List[ActivitySegment],
+        dtype=np.float32,
+        out: Optional[ImuChannels] = None,
+        workspace: Optional[Workspace] = None
+    ) -> ImuChannels:
+        if not isinstance(data, ImuChannels):
+            data = ImuChannels.from_records(data, dtype)
         if len(data) == 0:
             return data
         
-        filtered_data = np.copy(data)
-        timestamps = data['timestamp']
+        # out служит и накопителем смеси, поэтому не может совпадать с data
+        if out is None:
+            shape = data.signals.shape
+            signals = workspace.get('filtered', shape, dtype) if workspace is not None else np.empty(shape, dtype=dtype)
+            out = ImuChannels(signals, data.timestamp)
+        elif out.signals is data.signals:
+            raise ValueError("Filter.process cannot write over its input")
+        else:
+            out.timestamp[...] = data.timestamp
+        out.signals.fill(0)
+        
         unique_activities = set(seg.activity_type for seg in segments)
-        filtered_versions = {}
+        alpha_masks = self._create_alpha_masks(data.timestamp, segments, unique_activities, dtype, workspace)
+        if self.config.segment_local:
+            padding = int(self.config.segment_padding * self.config.sampling_rate)
+            ranges = {a: self._support_ranges(alpha_masks[a], padding) for a in unique_activities}
+        else:
+            ranges = {a: [(0, len(data))] for a in unique_activities}
         
         for activity_type in unique_activities:
-            cutoff_freq = self.config.cutoff_frequencies[activity_type]
-            filtered_versions[activity_type] = self._apply_butterworth_filter(
-                data, cutoff_freq
-            )
-        alpha_masks = self._create_alpha_masks(timestamps, segments, unique_activities)
-        for field in ['acc1', 'gyro1', 'acc2', 'gyro2']:
-            blended = np.zeros_like(data[field])
-            
-            for activity_type in unique_activities:
-                alpha = alpha_masks[activity_type]  
-                filtered_version = filtered_versions[activity_type][field]
-                
-                blended += filtered_version * alpha[:, np.newaxis]
-            
-            filtered_data[field] = blended
+            alpha = alpha_masks[activity_type]  
+            sos = self.get_sos(self.config.cutoff_frequencies[activity_type], fused=self.config.fuse_prefilter)
+            for start, end in ranges[activity_type]:
+                filtered_version = self._apply_sos(data.signals[start:end], sos, dtype)
+                filtered_version *= alpha[start:end, np.newaxis]
+                out.signals[start:end] += filtered_version
         
-        return filtered_data
+        return out
     
-    def _apply_butterworth_filter(
-        self, 
-        data: np.ndarray, 
-        cutoff_freq: float
-    ) -> np.ndarray:
+    def get_sos(self, cutoff_freq: float, fused: bool = False) -> np.ndarray:
         nyquist_freq = self.config.sampling_rate / 2.0
         if cutoff_freq >= nyquist_freq:
             cutoff_freq = nyquist_freq * 0.95 
         
-        filter_key = (cutoff_freq, self.config.filter_order)
-        if filter_key not in self._filter_cache:
-            sos = signal.butter(
-                self.config.filter_order,
-                cutoff_freq,
-                btype='low',
-                fs=self.config.sampling_rate,
-                output='sos' 
-            )
-            self._filter_cache[filter_key] = sos
-        else:
-            sos = self._filter_cache[filter_key]
-        
-        filtered = np.copy(data)
-        
-        for field in ['acc1', 'gyro1', 'acc2', 'gyro2']:
-            filtered[field] = signal.sosfiltfilt(
-                sos, 
-                data[field], 
-                axis=0  
+        if fused:
+            # Префильтр и фильтр активности одним каскадом
+            prefilter = clamp_prefilter_cutoff(self.config.prefilter_cutoff, self.config.sampling_rate)
+            return cascade_sos(
+                (prefilter, cutoff_freq), (PREFILTER_ORDER, self.config.filter_order), self.config.sampling_rate
             )
-        
-        return filtered
+        return cascade_sos((cutoff_freq,), self.config.filter_order, self.config.sampling_rate)
+
+    @staticmethod
+    def _apply_sos(
+        signals: np.ndarray, 
+        sos: np.ndarray,
+        dtype=np.float32
+    ) -> np.ndarray:
+        sos = sos.astype(dtype)
+        # Короткий участок (сегмент у края записи) не вмещает стандартное продолжение sosfiltfilt
+        padlen = min(3 * (2 * len(sos) + 1), len(signals) - 1)
+        return signal.sosfiltfilt(sos, signals.astype(dtype, copy=False), axis=0, padlen=padlen)
+    
+    @staticmethod
+    def _support_ranges(alpha: np.ndarray, padding: int) -> List[tuple]:
+        # Участки, где вес активности ненулевой, расширенные на padding; перекрывающиеся сливаются
+        support = np.flatnonzero(np.diff(np.concatenate(([0], alpha > 0, [0])).astype(np.int8)))
+        starts = np.maximum(support[0::2] - padding, 0)
+        ends = np.minimum(support[1::2] + padding, len(alpha))
+        ranges = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return [tuple(r) for r in ranges]
     
     def _create_alpha_masks(
         self,
         timestamps: np.ndarray,
         segments: List[ActivitySegment],
-        unique_activities: set
+        unique_activities: set,
+        dtype=np.float32,
+        workspace: Optional[Workspace] = None
     ) -> Dict[ActivityType, np.ndarray]:
         n_samples = len(timestamps)
         transition_samples = int(self.config.transition_duration * self.config.sampling_rate)
-        alpha_masks = {activity: np.zeros(n_samples) for activity in unique_activities}
-        for segment in segments:
-            mask = (timestamps >= segment.start_time) & (timestamps <= segment.end_time)
-            segment_indices = np.where(mask)[0]
-            
-            if len(segment_indices) == 0:
+        # Одна строка на активность; сегмент пишется только в свой диапазон индексов
+        if workspace is not None:
+            rows = workspace.get('alpha', (len(unique_activities), n_samples), dtype)
+            rows.fill(0)
+        else:
+            rows = np.zeros((len(unique_activities), n_samples), dtype=dtype)
+        alpha_masks = dict(zip(unique_activities, rows))
+        
+        # Метки времени возрастают, поэтому сегмент — непрерывный диапазон [start_idx, stop)
+        starts = np.searchsorted(timestamps, [seg.start_time for seg in segments], side='left')
+        stops = np.searchsorted(timestamps, [seg.end_time for seg in segments], side='right')
+        fade_curves = {}
+        
+        def fade(length: int, fade_type: str) -> np.ndarray:
+            key = (length, fade_type)
+            if key not in fade_curves:
+                fade_curves[key] = self._generate_fade_curve(length, fade_type=fade_type)
+            return fade_curves[key]
+        
+        for segment, start_idx, stop in zip(segments, starts.tolist(), stops.tolist()):
+            if stop <= start_idx:
                 continue
-            
-            alpha = np.zeros(n_samples)
-            alpha[segment_indices] = 1.0
-            
-            start_idx = segment_indices[0]
-            end_idx = segment_indices[-1]
+            end_idx = stop - 1
+            alpha = np.ones(stop - start_idx, dtype=dtype)
             
             fade_in_end = min(start_idx + transition_samples, end_idx)
             fade_in_length = fade_in_end - start_idx
             if fade_in_length > 0:
-                fade_in = self._generate_fade_curve(fade_in_length, fade_type='in')
-                alpha[start_idx:fade_in_end] *= fade_in
+                alpha[:fade_in_length] *= fade(fade_in_length, 'in')
             
             fade_out_start = max(end_idx - transition_samples, start_idx)
             fade_out_length = end_idx - fade_out_start
             if fade_out_length > 0:
-                fade_out = self._generate_fade_curve(fade_out_length, fade_type='out')
-                alpha[fade_out_start:end_idx] *= fade_out
+                alpha[fade_out_start - start_idx:end_idx - start_idx] *= fade(fade_out_length, 'out')
             
-            alpha_masks[segment.activity_type] += alpha
-        total_alpha = sum(alpha_masks.values())
+            alpha_masks[segment.activity_type][start_idx:stop] += alpha
+        
+        total_alpha = rows.sum(axis=0)
         zero_mask = total_alpha < 1e-6
         if np.any(zero_mask):
             if ActivityType.UNKNOWN in alpha_masks:
                 alpha_masks[ActivityType.UNKNOWN][zero_mask] = 1.0
                 total_alpha[zero_mask] = 1.0
         
-        for activity_type in alpha_masks:
-            alpha_masks[activity_type] = np.divide(
-                alpha_masks[activity_type],
-                total_alpha,
-                where=total_alpha > 1e-6,
-                out=np.zeros_like(alpha_masks[activity_type])
-            )
+        valid = total_alpha > 1e-6
+        np.divide(rows, total_alpha, where=valid, out=rows)
+        rows[:, ~valid] = 0.0
         
         return alpha_masks
     
@@ -1,3 +1,4 @@
+import math
 import warnings
 import numpy as np
 from numpy.linalg import norm
@@ -105,4 +106,76 @@ class MadgwickAHRS:
 
         # Integrate to yield quaternion
         q += qdot * self.samplePeriod
-        self.quaternion = Quaternion(q / norm(q))  # normalise quaternion
\ No newline at end of file
+        self.quaternion = Quaternion(q / norm(q))  # normalise quaternion
+
+    def update_imu_batch(self, gyroscope, accelerometer, out=None, block_size=65536):
+        gyroscope = np.asarray(gyroscope)
+        accelerometer = np.asarray(accelerometer)
+        n = len(gyroscope)
+        assert accelerometer.shape == (n, 3) and gyroscope.shape == (n, 3), \
+            "gyroscope и accelerometer должны иметь форму (N, 3)"
+        if out is None:
+            out = np.empty((n, 4), dtype=np.float64)
+
+        q0, q1, q2, q3 = (float(v) for v in self.quaternion.q)
+        beta = float(self.beta)
+        dt = float(self.samplePeriod)
+        sqrt = math.sqrt
+
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            gyro_block = gyroscope[start:end].astype(np.float64).tolist()
+            acc_block = accelerometer[start:end].astype(np.float64).tolist()
+            q_block = []
+
+            for (gx, gy, gz), (ax, ay, az) in zip(gyro_block, acc_block):
+                # Normalise accelerometer measurement
+                acc_norm = sqrt(ax*ax + ay*ay + az*az)
+                if acc_norm == 0:
+                    q_block.append((q0, q1, q2, q3))
+                    continue
+                ax /= acc_norm
+                ay /= acc_norm
+                az /= acc_norm
+
+                # Gradient descent algorithm corrective step
+                _2q0 = 2*q0
+                _2q1 = 2*q1
+                _2q2 = 2*q2
+                _2q3 = 2*q3
+                f0 = 2*(q1*q3 - q0*q2) - ax
+                f1 = 2*(q0*q1 + q2*q3) - ay
+                f2 = 2*(0.5 - q1*q1 - q2*q2) - az
+                s0 = -_2q2*f0 + _2q1*f1
+                s1 = _2q3*f0 + _2q0*f1 - 2*_2q1*f2
+                s2 = -_2q0*f0 + _2q3*f1 - 2*_2q2*f2
+                s3 = _2q1*f0 + _2q2*f1
+                step_norm = sqrt(s0*s0 + s1*s1 + s2*s2 + s3*s3)
+                if step_norm > 0:
+                    s0 /= step_norm
+                    s1 /= step_norm
+                    s2 /= step_norm
+                    s3 /= step_norm
+
+                # Compute rate of change of quaternion
+                qd0 = (-q1*gx - q2*gy - q3*gz) * 0.5 - beta * s0
+                qd1 = (q0*gx + q2*gz - q3*gy) * 0.5 - beta * s1
+                qd2 = (q0*gy - q1*gz + q3*gx) * 0.5 - beta * s2
+                qd3 = (q0*gz + q1*gy - q2*gx) * 0.5 - beta * s3
+
+                # Integrate to yield quaternion
+                q0 += qd0 * dt
+                q1 += qd1 * dt
+                q2 += qd2 * dt
+                q3 += qd3 * dt
+                q_norm = sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+                q0 /= q_norm
+                q1 /= q_norm
+                q2 /= q_norm
+                q3 /= q_norm
+                q_block.append((q0, q1, q2, q3))
+
+            out[start:end] = q_block
+
+        self.quaternion = Quaternion(q0, q1, q2, q3)
+        return out
@@ -92,4 +92,112 @@ class Quaternion:
         return self._q[item]
 
     def __array__(self):
-        return self._q
\ No newline at end of file
+        return self._q
+
+_CONJ = np.array([1.0, -1.0, -1.0, -1.0])
+
+
+class QuaternionArray:
+    def __init__(self, q):
+        if isinstance(q, QuaternionArray):
+            q = q.q
+        q = np.asarray(q, dtype=np.float64)
+        if q.ndim != 2 or q.shape[1] != 4:
+            raise ValueError("Expecting an (N, 4) array of quaternions")
+        self._q = q
+
+    @staticmethod
+    def from_components(w, x, y, z):
+        return QuaternionArray(np.stack([w, x, y, z], axis=1))
+
+    # Quaternion specific interfaces
+
+    def conj(self):
+        return QuaternionArray(self._q * _CONJ)
+
+    def norm(self):
+        return np.sqrt(np.einsum('ij,ij->i', self._q, self._q))
+
+    def normalized(self):
+        return QuaternionArray(self._q / self.norm()[:, np.newaxis])
+
+    def normalize(self):
+        self._q /= self.norm()[:, np.newaxis]
+        return self
+
+    def relative_to(self, reference):
+        # q_ref^-1 * q: поворот self относительно reference (например, голень относительно бедра)
+        if isinstance(reference, (Quaternion, QuaternionArray)):
+            reference = reference.q
+        reference_conj = np.asarray(reference, dtype=np.float64) * _CONJ
+        return QuaternionArray(_hamilton(reference_conj, self._q))
+
+    def to_euler_angles(self):
+        w, x, y, z = self.w, self.x, self.y, self.z
+        pitch = np.arcsin(np.clip(2 * x * y + 2 * w * z, -1.0, 1.0))
+        roll = np.arctan2(2 * w * x - 2 * y * z, 1 - 2 * x ** 2 - 2 * z ** 2)
+        yaw = np.arctan2(2 * w * y - 2 * x * z, 1 - 2 * y ** 2 - 2 * z ** 2)
+
+        north = np.abs(x * y + z * w - 0.5) < 1e-8
+        south = np.abs(x * y + z * w + 0.5) < 1e-8
+        if np.any(north) or np.any(south):
+            half_angle = 2 * np.arctan2(x, w)
+            roll = np.where(north, 0.0, np.where(south, -half_angle, roll))
+            yaw = np.where(north, half_angle, np.where(south, 0.0, yaw))
+        return roll, pitch, yaw
+
+    def __mul__(self, other):
+        if isinstance(other, QuaternionArray):
+            return QuaternionArray(_hamilton(self._q, other._q))
+        elif isinstance(other, Quaternion):
+            return QuaternionArray(_hamilton(self._q, np.asarray(other.q, dtype=np.float64)))
+        elif isinstance(other, numbers.Number):
+            return QuaternionArray(self._q * other)
+        return NotImplemented
+
+    def __rmul__(self, other):
+        if isinstance(other, numbers.Number):
+            return QuaternionArray(self._q * other)
+        return NotImplemented
+
+    @property
+    def q(self):
+        return self._q
+
+    @property
+    def w(self):
+        return self._q[:, 0]
+
+    @property
+    def x(self):
+        return self._q[:, 1]
+
+    @property
+    def y(self):
+        return self._q[:, 2]
+
+    @property
+    def z(self):
+        return self._q[:, 3]
+
+    def __len__(self):
+        return len(self._q)
+
+    def __getitem__(self, item):
+        if isinstance(item, numbers.Integral):
+            return Quaternion(self._q[item])
+        return QuaternionArray(self._q[item])
+
+    def __array__(self, dtype=None, copy=None):
+        return self._q if dtype is None else self._q.astype(dtype)
+
+
+def _hamilton(p, q):
+    p0, p1, p2, p3 = p[..., 0], p[..., 1], p[..., 2], p[..., 3]
+    q0, q1, q2, q3 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    out = np.empty(np.broadcast_shapes(p.shape, q.shape), dtype=np.float64)
+    out[..., 0] = p0*q0 - p1*q1 - p2*q2 - p3*q3
+    out[..., 1] = p0*q1 + p1*q0 + p2*q3 - p3*q2
+    out[..., 2] = p0*q2 - p1*q3 + p2*q0 + p3*q1
+    out[..., 3] = p0*q3 + p1*q2 - p2*q1 + p3*q0
+    return out
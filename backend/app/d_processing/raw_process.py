@@ -1,20 +1,46 @@
 import numpy as np
-from typing import Optional
+from typing import Optional, Dict
 from dataclasses import dataclass, field
 import json
 import os
+import logging
 import datetime
 
-from .unpacking import unpack_bin
+from .unpacking import unpack_bin, ImuChannels, N_CHANNELS
 from .imu_calibration import Calibrator
 from .lowp_f import prefiltration, Filter 
 from .madgwick import MadgwickAHRS
 from .step_detection import StepDetector
-from .quaternion import Quaternion
+from .quaternion import Quaternion, QuaternionArray
 from .detect_act import ActivityDetector
 from .step_pro import calculate_step_metrics
-from .session_pro import calculate_session_summary
-from .dclass import Metadata
+from . import session_pro
+from .instrumentation import StageInstrumentation
+from .caching import ResultCache, ArtifactCache, CachedResult, CACHE_VERSION, fingerprint, hash_raw
+from .dclass import Metadata, ProcessingReport, PrecisionPolicy
+from .workspace import Workspace, writable_copy
+
+logger = logging.getLogger('GaitAnalysis')
+
+# Стадии с кэшируемым результатом, в порядке выполнения, и файлы, которые каждая сохраняет
+ARTIFACT_STAGES = ['calibrated', 'prefiltered', 'segments', 'filtered', 'orientation']
+# Каналы хранятся матрицами (N, 12); время общее для всех стадий и зависит только от входа
+ARTIFACT_FILES = {
+    'timestamp': ['timestamp'],
+    'calibrated': ['calibrated'],
+    'prefiltered': ['prefiltered'],
+    'segments': ['segments'],
+    'filtered': ['filtered'],
+    'orientation': ['orientations', 'acc_vertical']
+}
+# Что нужно загрузить, чтобы продолжить после данной стадии
+RESUME_REQUIRES = {
+    'calibrated': ['timestamp', 'calibrated'],
+    'prefiltered': ['timestamp', 'prefiltered'],
+    'segments': ['timestamp', 'prefiltered', 'segments'],
+    'filtered': ['timestamp', 'segments', 'filtered'],
+    'orientation': ['timestamp', 'segments', 'filtered', 'orientation']
+}
 
 def quaternion_to_euler(q: np.ndarray) -> np.ndarray:
         w, x, y, z = q
@@ -35,18 +61,44 @@ def quaternion_to_euler(q: np.ndarray) -> np.ndarray:
 
         return np.array([roll, pitch, yaw])
 
+ORIENTATION_DTYPE = np.dtype([
+    ('thigh_pitch', 'f4'), ('shank_pitch', 'f4'), ('knee_angle', 'f4'),
+    ('thigh_roll', 'f4'), ('thigh_yaw', 'f4'),
+    ('shank_roll', 'f4'), ('shank_yaw', 'f4')
+])
+
+def orientation_angles(q_thigh: QuaternionArray, q_shank: QuaternionArray, acc_shank: np.ndarray, dtype=np.float32):
+    orientations = np.zeros(len(q_thigh), dtype=ORIENTATION_DTYPE)
+    pitch = {}
+    for segment, q in (('thigh', q_thigh), ('shank', q_shank)):
+        roll, pitch[segment], yaw = np.rad2deg(q.to_euler_angles())
+        orientations[f'{segment}_roll'] = roll
+        orientations[f'{segment}_pitch'] = pitch[segment]
+        orientations[f'{segment}_yaw'] = yaw
+    orientations['knee_angle'] = pitch['thigh'] - pitch['shank']
+
+    w, x, y, z = q_shank.w, q_shank.x, q_shank.y, q_shank.z
+    z_global = (acc_shank[:, 0] * (2*x*z + 2*w*y) + acc_shank[:, 1] * (2*y*z - 2*w*x) + acc_shank[:, 2] * (1 - 2*x**2 - 2*y**2))
+    acc_vertical = (z_global - 9.81).astype(dtype, copy=False)
+    return orientations, acc_vertical
+
 class GaitAnalysisOrchestrator:
     def __init__(
         self,
-        unpack_bin= None,
+        unpack_bin=unpack_bin,
         calibrator=Calibrator(),
-        prefiltration= None,
+        prefiltration=prefiltration,
         activity_detector=ActivityDetector(),
         filter=Filter(),
         event_detector=StepDetector(),
-        calculate_step_metrics= None,
-        session = None,
-        sampling_rate: int = 125
+        calculate_step_metrics=calculate_step_metrics,
+        session=session_pro,
+        sampling_rate: int = 125,
+        instrumentation: Optional[StageInstrumentation] = None,
+        result_cache: Optional[ResultCache] = None,
+        artifact_cache: Optional[ArtifactCache] = None,
+        precision: Optional[PrecisionPolicy] = None,
+        workspace: Optional[Workspace] = None
     ):
         self.unpacking = unpack_bin
         self.calibrator = calibrator
@@ -58,94 +110,303 @@ class GaitAnalysisOrchestrator:
         self.session = session
         self.sampling_rate = sampling_rate
         self.dt = 1.0 / sampling_rate
+        self.instrumentation = instrumentation if instrumentation is not None else StageInstrumentation()
+        self.report: Optional[ProcessingReport] = None
+        self.result_cache = result_cache
+        self.artifact_cache = artifact_cache
+        self.precision = precision if precision is not None else PrecisionPolicy()
+        # С рабочим пространством калибровка, префильтрация и адаптивный фильтр
+        # пишут в один переиспользуемый буфер вместо новой копии записи на каждой стадии
+        self.workspace = workspace
+        self.step_metrics = None
         
         self.madgwick_thigh = MadgwickAHRS(sampleperiod=self.dt, beta=0.1)
         self.madgwick_shank = MadgwickAHRS(sampleperiod=self.dt, beta=0.1)
     
-    def process_session(self, raw_data, metadata, device_id: str = None):
+    def process_session(self, raw_data, metadata, device_id: str = None, return_report: bool = False):
         if device_id is None:
             if isinstance(raw_data, str):
                 device_id = os.path.splitext(os.path.basename(raw_data))[0]
             else:
                 device_id = "unknown_device"
 
+        self.instrumentation.start(session_id=getattr(metadata, 'session_id', None), device_id=device_id)
+        self.step_metrics = None
         try:
-            if isinstance(raw_data, str):
-                unpacked = self.unpacking(raw_data)
-            else:
-                unpacked = raw_data
-        except Exception as e:
-            unpacked = raw_data
+            result = self._run_cached(raw_data, metadata, device_id)
+        finally:
+            self.report = self.instrumentation.finish()
+            if self.workspace is not None:
+                self.workspace.trim()
 
+        if return_report:
+            return result, self.report
+        return result
+
+    def _run_cached(self, raw_data, metadata, device_id: str):
+        if self.result_cache is None:
+            return self._run_stages(raw_data, metadata, device_id)
+
+        key = raw_hash = None
         try:
-            self.calibrator.load(device_id)
-            self.calibrator.align_to_gravity(unpacked)
-            calibrated = self.calibrator.apply(unpacked)
-        except Exception as e:
-            calibrated = unpacked
-            return f' Have an error in calibration: {e}'
-        
-        try:
-            prefiltrated = self.prefiltration(calibrated)
+            with self.instrumentation.stage('result_cache', 0):
+                raw_hash = hash_raw(raw_data)
+                key = self.cache_key(raw_hash, metadata, device_id)
+                cached = self.result_cache.get(key)
         except Exception as e:
-            prefiltrated = calibrated
-            return ' Have an error: {e}'
-        
+            # Без ключа просто считаем заново; ошибки входа всплывут в стадиях
+            logger.warning(f"Result cache lookup failed: {e}")
+            cached = None
+
+        if cached is not None:
+            bound = cached.bind(metadata)
+            self.step_metrics = bound.step_metrics
+            return bound.summary
+
+        result = self._run_stages(raw_data, metadata, device_id, raw_hash)
+        if key is not None and isinstance(result, dict):
+            try:
+                self.result_cache.put(key, CachedResult(
+                    summary=result, step_metrics=self.step_metrics, start_time=metadata.start_time
+                ))
+            except Exception as e:
+                logger.warning(f"Result cache store failed: {e}")
+        return result
+
+    def cache_key(self, raw_hash: str, metadata, device_id: str) -> str:
+        self.calibrator.load(device_id)
+        config = fingerprint(
+            CACHE_VERSION,
+            self.sampling_rate,
+            self.precision,
+            self.event_detector.config,
+            self.filter.config,
+            self.activity_detector.config,
+            self.calibrator.sensor1_cal.to_dict(),
+            self.calibrator.sensor2_cal.to_dict(),
+            # рост влияет на оценку скорости и длины шага
+            metadata.height
+        )
+        return f"{raw_hash}-{config}"
+
+    def artifact_keys(self, raw_hash: str, device_id: str) -> Dict[str, str]:
+        # Ключ каждой стадии включает ключ предыдущей: изменение входа или конфигурации
+        # инвалидирует эту стадию и все последующие
+        self.calibrator.load(device_id)
+        keys = {}
+        keys['timestamp'] = fingerprint(CACHE_VERSION, 'timestamp', raw_hash)
+        keys['calibrated'] = fingerprint(
+            CACHE_VERSION, 'calibrated', raw_hash, self.sampling_rate, self.precision,
+            self.calibrator.sensor1_cal.to_dict(), self.calibrator.sensor2_cal.to_dict()
+        )
+        keys['prefiltered'] = fingerprint(
+            CACHE_VERSION, 'prefiltered', keys['calibrated'],
+            getattr(self.prefiltration, '__qualname__', repr(self.prefiltration))
+        )
+        keys['segments'] = fingerprint(CACHE_VERSION, 'segments', keys['prefiltered'], self.activity_detector.config)
+        keys['filtered'] = fingerprint(CACHE_VERSION, 'filtered', keys['segments'], self.filter.config)
+        keys['orientation'] = fingerprint(
+            CACHE_VERSION, 'orientation', keys['filtered'],
+            [(m.beta, m.samplePeriod, m.quaternion.q) for m in (self.madgwick_thigh, self.madgwick_shank)]
+        )
+        return keys
+
+    @property
+    def fused_filtering(self) -> bool:
+        return getattr(self.filter.config, 'fuse_prefilter', False)
+
+    def _resume_requires(self) -> Dict[str, list]:
+        if not self.fused_filtering:
+            return RESUME_REQUIRES
+        # Слитый фильтр читает калиброванный сигнал, а префильтрованный нужен только детектору активности
+        requires = dict(RESUME_REQUIRES)
+        requires['prefiltered'] = ['timestamp', 'calibrated', 'prefiltered']
+        requires['segments'] = ['timestamp', 'calibrated', 'segments']
+        return requires
+
+    def _resume_point(self, keys: Dict[str, str]) -> Optional[str]:
+        requires = self._resume_requires()
+        for name in reversed(ARTIFACT_STAGES):
+            if all(self.artifact_cache.has(keys[stage], ARTIFACT_FILES[stage]) for stage in requires[name]):
+                return name
+        return None
+
+    def _open_artifacts(self, raw_data, device_id: str, raw_hash: Optional[str]):
+        if self.artifact_cache is None:
+            return None, None, {}
         try:
-            activities = self.activity_detector.detect(prefiltrated)
+            with self.instrumentation.stage('artifact_cache', 0):
+                keys = self.artifact_keys(raw_hash or hash_raw(raw_data), device_id)
+                resume = self._resume_point(keys)
+                loaded = {}
+                if resume is not None:
+                    for stage in self._resume_requires()[resume]:
+                        for name in ARTIFACT_FILES[stage]:
+                            loaded[name] = self.artifact_cache.load(keys[stage], name)
+            return keys, resume, loaded
         except Exception as e:
-            activities = []
-            return ' Have an error: {e}'
-        
+            logger.warning(f"Artifact cache lookup failed: {e}")
+            return None, None, {}
+
+    def _save_artifacts(self, keys: Optional[Dict[str, str]], stage: str, **values):
+        if keys is None:
+            return
         try:
-            filtrated = self.filter.process(prefiltrated, activities)
+            for name, value in values.items():
+                self.artifact_cache.save(keys[stage], name, value)
         except Exception as e:
-            filtrated = prefiltrated
-            return ' Have an error: {e}'
-        
+            logger.warning(f"Artifact cache store failed for {stage}: {e}")
+
+    def _run_stages(self, raw_data, metadata, device_id: str, raw_hash: Optional[str] = None):
+        stage = self.instrumentation.stage
+        keys, resume, loaded = self._open_artifacts(raw_data, device_id, raw_hash)
+        done = ARTIFACT_STAGES[:ARTIFACT_STAGES.index(resume) + 1] if resume is not None else []
+
+        def channels(name: str) -> Optional[ImuChannels]:
+            return ImuChannels(loaded[name], loaded['timestamp']) if name in loaded else None
+
+        calibrated = channels('calibrated')
+        prefiltrated = channels('prefiltered')
+        activities = loaded.get('segments')
+        filtrated = channels('filtered')
+        orientations = loaded.get('orientations')
+        acc_vertical = loaded.get('acc_vertical')
+
+        if 'calibrated' in done:
+            n_samples = len(next(v for v in loaded.values() if isinstance(v, np.ndarray)))
+        else:
+            try:
+                with stage('unpacking', 0) as unpacking:
+                    if isinstance(raw_data, np.ndarray):
+                        unpacked = raw_data
+                    else:
+                        unpacked = self.unpacking(raw_data)
+                    unpacking.n_samples = len(unpacked)
+            except Exception as e:
+                return f' Have an error in unpacking: {e}'
+
+            n_samples = len(unpacked)
+
+            try:
+                with stage('calibration', n_samples):
+                    self.calibrator.load(device_id)
+                    self.calibrator.align_to_gravity(unpacked)
+                    out = None
+                    if self.workspace is not None:
+                        out = ImuChannels(
+                            self.workspace.get('signal', (n_samples, N_CHANNELS), self.precision.signal_dtype),
+                            self.workspace.get('timestamp', n_samples, np.float64)
+                        )
+                    calibrated = self.calibrator.apply(unpacked, dtype=self.precision.signal_dtype, out=out)
+            except Exception as e:
+                return f' Have an error in calibration: {e}'
+            self._save_artifacts(keys, 'timestamp', timestamp=calibrated.timestamp)
+            self._save_artifacts(keys, 'calibrated', calibrated=calibrated.signals)
+        self.instrumentation.report.n_samples = n_samples
+
+        if 'prefiltered' not in done:
+            try:
+                with stage('prefiltration', n_samples):
+                    if self.workspace is None:
+                        prefiltrated = self.prefiltration(calibrated, fs=self.sampling_rate, dtype=self.precision.signal_dtype)
+                    else:
+                        if self.fused_filtering:
+                            # Калиброванный сигнал ещё понадобится слитому фильтру
+                            out = ImuChannels(
+                                self.workspace.get('prefiltered', calibrated.signals.shape, self.precision.signal_dtype),
+                                calibrated.timestamp
+                            )
+                        else:
+                            out = calibrated = self._writable(calibrated)
+                        prefiltrated = self.prefiltration(
+                            calibrated, fs=self.sampling_rate, dtype=self.precision.signal_dtype, out=out
+                        )
+            except Exception as e:
+                return f' Have an error in prefiltration: {e}'
+            self._save_artifacts(keys, 'prefiltered', prefiltered=prefiltrated.signals)
+
+        if 'segments' not in done:
+            try:
+                with stage('activity_detection', n_samples):
+                    activities = self.activity_detector.detect(prefiltrated)
+            except Exception as e:
+                return f' Have an error in activity detection: {e}'
+            self._save_artifacts(keys, 'segments', segments=activities)
+
+        if 'filtered' not in done:
+            try:
+                with stage('adaptive_filtering', n_samples):
+                    source = calibrated if self.fused_filtering else prefiltrated
+                    if self.workspace is None:
+                        filtrated = self.filter.process(source, activities, dtype=self.precision.signal_dtype)
+                    else:
+                        filtrated = self.filter.process(
+                            source, activities, dtype=self.precision.signal_dtype, workspace=self.workspace
+                        )
+            except Exception as e:
+                return f' Have an error in filtering: {e}'
+            self._save_artifacts(keys, 'filtered', filtered=filtrated.signals)
+
+        if 'orientation' not in done:
+            try:
+                with stage('orientation', n_samples):
+                    orientations, acc_vertical = self.estimate_orientation(filtrated)
+            except Exception as e:
+                return f' Have an error in orientation: {e}'
+            self._save_artifacts(keys, 'orientation', orientations=orientations, acc_vertical=acc_vertical)
+
         try:
-            cycles, orientations = self.orientation(filtrated)
+            with stage('step_detection', n_samples):
+                cycles = self.detect_cycles(filtrated, acc_vertical)
         except Exception as e:
-            cycles, orientations = []
-            return ' Have an error: {e}'
+            return f' Have an error in step detection: {e}'
         
         try:
-            metrics_list = self.calculate_step_metrics(filtrated, orientations, cycles)
+            with stage('step_metrics', n_samples):
+                metrics_list = self.calculate_step_metrics(
+                    filtrated, orientations, cycles, fs=self.sampling_rate, metadata=metadata
+                )
+                self.step_metrics = metrics_list
         except Exception as e:
-            return ' Have an error: {e}'
+            return f' Have an error in step metrics: {e}'
         
         try:
-            session_summary = self.session.calculate_session_summary(metrics_list, orientations, activities, metadata)
+            with stage('session_summary', n_samples):
+                session_summary = self.session.calculate_session_summary(metrics_list, orientations, activities, metadata)
         except Exception as e:
-            return ' Have an error: {e}'
+            return f' Have an error in session summary: {e}'
 
         return session_summary
 
-    def orientation(self, filtrated: np.ndarray):
+    def _writable(self, channels: ImuChannels) -> ImuChannels:
+        # Загруженные из кэша артефакты открыты на чтение; их копия ложится в тот же буфер
+        if channels.signals.flags.writeable:
+            return channels
+        return ImuChannels(writable_copy(channels.signals, self.workspace, 'signal'), channels.timestamp)
+
+    def estimate_orientation(self, filtrated: ImuChannels):
         n = len(filtrated)
-        orientations = np.zeros(n, dtype=[('thigh_pitch', 'f4'), ('shank_pitch', 'f4'), ('knee_angle', 'f4')])
-        acc_vertical = np.zeros(n)
-        gyro_shank_rad = np.deg2rad(filtrated['gyro2'])
-        sag_idx = np.argmax(np.std(gyro_shank_rad, axis=0))
-        gyro_sagittal = filtrated['gyro2'][:, sag_idx]
+        integration = self.precision.integration_dtype
 
-        for i in range(n):
-            self.madgwick_thigh.update_imu(np.deg2rad(filtrated['gyro1'][i]), filtrated['acc1'][i])
-            t_pitch = np.rad2deg(self.madgwick_thigh.quaternion.to_euler_angles()[1]) 
-        
-            self.madgwick_shank.update_imu(gyro_shank_rad[i], filtrated['acc2'][i])
-            q_s = self.madgwick_shank.quaternion.q
-            s_pitch = np.rad2deg(self.madgwick_shank.quaternion.to_euler_angles()[1])
-        
-            ax, ay, az = filtrated['acc2'][i]
-            w, x, y, z = q_s
-            z_global = (ax * (2*x*z + 2*w*y) + ay * (2*y*z - 2*w*x) + az * (1 - 2*x**2 - 2*y**2))
-            acc_vertical[i] = z_global - 9.81
-        
-            orientations[i]['thigh_pitch'] = t_pitch
-            orientations[i]['shank_pitch'] = s_pitch
-            orientations[i]['knee_angle'] = t_pitch - s_pitch
+        def buffer(name: str) -> np.ndarray:
+            if self.workspace is not None:
+                return self.workspace.get(name, (n, 4), integration)
+            return np.empty((n, 4), dtype=integration)
+
+        q_thigh = QuaternionArray(self.madgwick_thigh.update_imu_batch(
+            np.deg2rad(filtrated['gyro1']), filtrated['acc1'], out=buffer('q_thigh')
+        ))
+        q_shank = QuaternionArray(self.madgwick_shank.update_imu_batch(
+            np.deg2rad(filtrated['gyro2']), filtrated['acc2'], out=buffer('q_shank')
+        ))
+        return orientation_angles(q_thigh, q_shank, filtrated['acc2'], dtype=self.precision.signal_dtype)
+
+    def detect_cycles(self, filtrated: ImuChannels, acc_vertical: np.ndarray):
+        sag_idx = np.argmax(np.std(filtrated['gyro2'], axis=0))
+        gyro_sagittal = filtrated['gyro2'][:, sag_idx]
+        return self.event_detector.detect_cycles(gyro_sagittal, acc_vertical, filtrated['timestamp'])
 
-        cycles = self.event_detector.detect_cycles(gyro_sagittal, acc_vertical, filtrated['timestamp'])
+    def orientation(self, filtrated: ImuChannels):
+        orientations, acc_vertical = self.estimate_orientation(filtrated)
+        cycles = self.detect_cycles(filtrated, acc_vertical)
         return cycles, orientations
-  
\ No newline at end of file
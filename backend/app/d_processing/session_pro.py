@@ -44,7 +44,6 @@ def calculate_session_summary(
         'is_processed': True,
         'status': SessionStatus.COMPLETED.value,
         'activity_type': activities,
-  -
         'step_count': len(clean_metrics),
         'cadence': basic_stats['cadence'],
         'avg_speed': avg_speed['avg_speed'],
@@ -107,6 +106,7 @@ def _calculate_basic_temporal_stats(metrics_list: List[Dict]) -> Dict[str, float
     else:
         cadence = 0.0
 
+    avg_step_time = float(np.mean(step_times)) if len(step_times) > 0 else 0.0
     avg_stance_time = float(np.mean(stance_times)) if len(stance_times) > 0 else 0.0
     avg_swing_time = float(np.mean(swing_times)) if len(swing_times) > 0 else 0.0
     
@@ -119,6 +119,7 @@ def _calculate_basic_temporal_stats(metrics_list: List[Dict]) -> Dict[str, float
         'step_count': int(step_count),
         'duration': round(duration, 3),
         'cadence': round(cadence, 2),
+        'avg_step_time': round(avg_step_time, 4),
         'avg_stance_time': round(avg_stance_time, 4),
         'avg_swing_time': round(avg_swing_time, 4),
         'stance_swing_ratio': round(stance_swing_ratio, 3)
@@ -1,9 +1,17 @@
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import List, Dict, Optional, Tuple
 from scipy import signal
 from .dclass import GaitCycle, DetectorConfig
 
+CYCLE_DTYPE = np.dtype([
+    (f.name, np.int64 if f.type is int else np.float64) for f in fields(GaitCycle)
+])
+
+def gait_cycles(cycles: np.ndarray) -> List[GaitCycle]:
+    return [GaitCycle(**dict(zip(CYCLE_DTYPE.names, row))) for row in cycles.tolist()]
+
 class StepDetector:
     def __init__(self, config: Optional[DetectorConfig] = None):
         self.config = config if config is not None else DetectorConfig()
@@ -13,7 +21,8 @@ class StepDetector:
         gyro_sagittal: np.ndarray,
         acc_vertical: np.ndarray,
         timestamps: Optional[np.ndarray] = None
-    ) -> List[GaitCycle]:
+    ) -> np.ndarray:
+        # Циклы возвращаются массивом CYCLE_DTYPE, по строке на цикл
         assert len(gyro_sagittal) == len(acc_vertical), \
             "Длины gyro_sagittal и acc_vertical должны совпадать"
         
@@ -24,60 +33,46 @@ class StepDetector:
         ms_indices = self._detect_mid_swing_peaks(gyro_sagittal)
         
         if len(ms_indices) < 2:
-            return []  
-        hs_indices = []
-        for ms_idx in ms_indices:
-            hs_idx = self._detect_heel_strike(
-                gyro_sagittal, acc_vertical, ms_idx
-            )
-            if hs_idx is not None:
-                hs_indices.append(hs_idx)
+            return np.zeros(0, dtype=CYCLE_DTYPE)
+        hs_indices = self._detect_heel_strikes(gyro_sagittal, acc_vertical, ms_indices)
         
         if len(hs_indices) < 2:
-            return []  
-        cycles = []
-        
-        for i in range(len(hs_indices) - 1):
-            current_hs = hs_indices[i]
-            next_hs = hs_indices[i + 1]
-            duration = (next_hs - current_hs) / self.config.sampling_rate
-            if duration < self.config.min_step_duration or \
-               duration > self.config.max_step_duration:
-                continue
-            ms_candidates = ms_indices[(ms_indices > current_hs) & (ms_indices < next_hs)]
-            if len(ms_candidates) == 0:
-                continue
-            
-            if len(ms_candidates) > 1:
-                peak_heights = gyro_sagittal[ms_candidates]
-                ms_idx = ms_candidates[np.argmax(peak_heights)]
-            else:
-                ms_idx = ms_candidates[0]
-            
-            to_idx = self._detect_toe_off(
-                gyro_sagittal, current_hs, ms_idx
-            )
-            
-            if to_idx is None:
-                continue
-            
-            stride_time = duration
-            stance_time = (to_idx - current_hs) / self.config.sampling_rate
-            swing_time = (next_hs - to_idx) / self.config.sampling_rate
-            cadence = 60.0 / stride_time  
-            
-            cycle = GaitCycle(
-                hs_idx=current_hs,
-                to_idx=to_idx,
-                next_hs_idx=next_hs,
-                ms_idx=ms_idx,
-                duration=duration,
-                stride_time=stride_time,
-                stance_time=stance_time,
-                swing_time=swing_time,
-                cadence=cadence
-            )
-            cycles.append(cycle)
+            return np.zeros(0, dtype=CYCLE_DTYPE)
+        
+        fs = self.config.sampling_rate
+        current_hs = hs_indices[:-1]
+        next_hs = hs_indices[1:]
+        duration = (next_hs - current_hs) / fs
+        # Кандидаты MS строго между соседними HS; ms_indices отсортированы
+        first = np.searchsorted(ms_indices, current_hs, side='right')
+        last = np.searchsorted(ms_indices, next_hs, side='left')
+        keep = (
+            (duration >= self.config.min_step_duration) &
+            (duration <= self.config.max_step_duration) &
+            (last > first)
+        )
+        current_hs, next_hs, duration, first, last = (
+            x[keep] for x in (current_hs, next_hs, duration, first, last)
+        )
+        
+        ms_idx = ms_indices[first]
+        for i in np.flatnonzero(last - first > 1):
+            ms_candidates = ms_indices[first[i]:last[i]]
+            ms_idx[i] = ms_candidates[np.argmax(gyro_sagittal[ms_candidates])]
+        
+        to_idx = self._detect_toe_offs(gyro_sagittal, current_hs, ms_idx)
+        found = to_idx >= 0
+        
+        cycles = np.zeros(int(found.sum()), dtype=CYCLE_DTYPE)
+        cycles['hs_idx'] = current_hs[found]
+        cycles['to_idx'] = to_idx[found]
+        cycles['next_hs_idx'] = next_hs[found]
+        cycles['ms_idx'] = ms_idx[found]
+        cycles['duration'] = duration[found]
+        cycles['stride_time'] = duration[found]
+        cycles['stance_time'] = (cycles['to_idx'] - cycles['hs_idx']) / fs
+        cycles['swing_time'] = (cycles['next_hs_idx'] - cycles['to_idx']) / fs
+        cycles['cadence'] = 60.0 / cycles['stride_time']
         
         if self.config.enable_outlier_removal and len(cycles) > 3:
             cycles = self._remove_outliers(cycles)
@@ -100,6 +95,84 @@ class StepDetector:
         
         return peaks
     
+    def _detect_heel_strikes(
+        self,
+        gyro_sagittal: np.ndarray,
+        acc_vertical: np.ndarray,
+        ms_indices: np.ndarray
+    ) -> np.ndarray:
+        # Окна поиска всех HS — строки одного strided-представления. Хвост за концом записи
+        # заполнен NaN: на нём смены знака нет, как и в укороченном окне.
+        # Строки без смены знака идут в поокенный _detect_heel_strike
+        search_window = int(self.config.hs_search_window * self.config.sampling_rate)
+        hs_indices = np.array(ms_indices, dtype=np.int64)
+        has_crossing = np.zeros(len(ms_indices), dtype=bool)
+        if search_window > 1:
+            padded = np.full(len(gyro_sagittal) + search_window, np.nan, dtype=np.result_type(gyro_sagittal, np.float32))
+            padded[:len(gyro_sagittal)] = gyro_sagittal
+            windows = sliding_window_view(padded, search_window)[ms_indices]
+            falling = np.diff(np.sign(windows), axis=1) < 0
+            has_crossing = falling.any(axis=1)
+            hs_indices += np.argmax(falling, axis=1)
+        
+        for i in np.flatnonzero(~has_crossing):
+            hs_idx = self._detect_heel_strike(gyro_sagittal, acc_vertical, ms_indices[i])
+            hs_indices[i] = -1 if hs_idx is None else hs_idx
+        return hs_indices[hs_indices >= 0]
+    
+    def _detect_toe_offs(
+        self,
+        gyro_sagittal: np.ndarray,
+        hs_indices: np.ndarray,
+        ms_indices: np.ndarray
+    ) -> np.ndarray:
+        # Все окна поиска TO склеиваются в один сигнал через разделители +inf: основание пика
+        # не ищется за разделителем, поэтому пики и их prominence те же, что в отдельном окне.
+        # Если выраженного минимума нет, берётся argmin окна; -1 — TO не найден
+        search_window = int(self.config.to_search_window * self.config.sampling_rate)
+        starts = np.maximum(hs_indices, ms_indices - search_window)
+        to_indices = np.full(len(starts), -1, dtype=np.int64)
+        rows = np.flatnonzero(ms_indices > starts)
+        if len(rows) == 0:
+            return to_indices
+        
+        starts = starts[rows]
+        lengths = ms_indices[rows] - starts
+        window_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        local = np.arange(lengths.sum()) - np.repeat(window_starts, lengths)
+        gyro = np.asarray(gyro_sagittal[np.repeat(starts, lengths) + local], dtype=np.float64)
+        
+        means = np.add.reduceat(gyro, window_starts) / lengths
+        stds = np.sqrt(np.add.reduceat((gyro - np.repeat(means, lengths))**2, window_starts) / lengths)
+        
+        offsets = window_starts + np.arange(len(rows)) + 1
+        joined = np.full(lengths.sum() + len(rows) + 1, np.inf)
+        joined[np.repeat(offsets, lengths) + local] = -gyro
+        
+        # Разделители тоже находятся как пики; их отбрасывают до расчёта prominence,
+        # иначе основание для них искалось бы до начала сигнала
+        candidates, _ = signal.find_peaks(joined)
+        candidates = candidates[np.isfinite(joined[candidates])]
+        owner = np.searchsorted(offsets, candidates, side='right') - 1
+        prominences, _, _ = signal.peak_prominences(joined, candidates)
+        prominent = prominences >= self.config.to_gyro_prominence_factor * stds[owner]
+        minima, owner = candidates[prominent], owner[prominent]
+        
+        # Последний выраженный минимум окна
+        is_last = np.append(owner[1:] != owner[:-1], True)[:len(owner)]
+        owner, minima = owner[is_last], minima[is_last]
+        to_indices[rows[owner]] = starts[owner] + minima - offsets[owner]
+        
+        missing = np.ones(len(rows), dtype=bool)
+        missing[owner] = False
+        if missing.any():
+            # Первый минимум окна, как у np.argmin
+            minimum = np.minimum.reduceat(gyro, window_starts)
+            at_minimum = gyro == np.repeat(minimum, lengths)
+            first = np.minimum.reduceat(np.where(at_minimum, local, lengths.max()), window_starts)
+            to_indices[rows[missing]] = (starts + first)[missing]
+        return to_indices
+    
     def _detect_heel_strike(
         self,
         gyro_sagittal: np.ndarray,
@@ -135,41 +208,11 @@ class StepDetector:
         
         return None
     
-    def _detect_toe_off(
-        self,
-        gyro_sagittal: np.ndarray,
-        hs_idx: int,
-        ms_idx: int
-    ) -> Optional[int]:
-        search_window = int(self.config.to_search_window * self.config.sampling_rate)
-        search_start = max(hs_idx, ms_idx - search_window)
-        search_end = ms_idx
-        
-        if search_end <= search_start:
-            return None
-        
-        gyro_window = gyro_sagittal[search_start:search_end]
-        
-        signal_std = np.std(gyro_window)
-        prominence_threshold = self.config.to_gyro_prominence_factor * signal_std
-        
-        minima, properties = signal.find_peaks(
-            -gyro_window,
-            prominence=prominence_threshold
-        )
-        
-        if len(minima) == 0:
-            min_idx = np.argmin(gyro_window)
-            return search_start + min_idx
-        
-        to_idx_relative = minima[-1]
-        return search_start + to_idx_relative
-    
-    def _remove_outliers(self, cycles: List[GaitCycle]) -> List[GaitCycle]:
+    def _remove_outliers(self, cycles: np.ndarray) -> np.ndarray:
         if len(cycles) < 3:
             return cycles
         
-        durations = np.array([c.duration for c in cycles])
+        durations = cycles['duration']
         
         mean_duration = np.mean(durations)
         std_duration = np.std(durations)
@@ -180,18 +223,16 @@ class StepDetector:
         z_scores = np.abs((durations - mean_duration) / std_duration)
         
         valid_mask = z_scores < self.config.outlier_std_threshold
-        filtered_cycles = [c for c, valid in zip(cycles, valid_mask) if valid]
-        
-        return filtered_cycles
+        return cycles[valid_mask]
     
-    def get_statistics(self, cycles: List[GaitCycle]) -> Dict[str, float]:
+    def get_statistics(self, cycles: np.ndarray) -> Dict[str, float]:
         if len(cycles) == 0:
             return {}
         
-        stride_times = np.array([c.stride_time for c in cycles])
-        stance_times = np.array([c.stance_time for c in cycles])
-        swing_times = np.array([c.swing_time for c in cycles])
-        cadences = np.array([c.cadence for c in cycles])
+        stride_times = cycles['stride_time']
+        stance_times = cycles['stance_time']
+        swing_times = cycles['swing_time']
+        cadences = cycles['cadence']
         
         stats = {
             'mean_stride_time': float(np.mean(stride_times)),
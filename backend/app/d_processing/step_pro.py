@@ -34,7 +34,11 @@ def calculate_step_metrics(
     
     for step_idx, step in enumerate(steps):
         try:
-            if hasattr(step, 'hs_idx'):
+            if isinstance(step, np.void):
+                hs_idx = step['hs_idx']
+                to_idx = step['to_idx']
+                next_hs_idx = step['next_hs_idx']
+            elif hasattr(step, 'hs_idx'):
                 hs_idx = step.hs_idx
                 to_idx = step.to_idx
                 next_hs_idx = step.next_hs_idx
@@ -0,0 +1,296 @@
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .unpacking import IMU_DTYPE
+from .dclass import SyntheticGaitConfig, GaitGroundTruth, ActivitySegment
+from .detect_act import ActivityType
+
+G = 9.81
+CHUNK_SAMPLES = 1 << 20
+
+# Параметры активностей относительно ходьбы: темп, доля опоры,
+# амплитуда сагиттальной угловой скорости голени и бедра (град/с), удар при HS (м/с²)
+ACTIVITY_PROFILES = {
+    ActivityType.WALKING: dict(cadence_scale=1.0, stance_shift=0.0, swing_peak=300.0, thigh_peak=120.0, impact=4.0),
+    ActivityType.STAIRS: dict(cadence_scale=0.8, stance_shift=0.05, swing_peak=240.0, thigh_peak=160.0, impact=3.0),
+    ActivityType.RUNNING: dict(cadence_scale=1.5, stance_shift=-0.2, swing_peak=550.0, thigh_peak=250.0, impact=15.0),
+}
+
+
+class _StridePlan:
+    def __init__(self, config: SyntheticGaitConfig):
+        self.config = config
+        rng = np.random.default_rng(config.seed)
+        self.activities = self._schedule(rng)
+
+        hs, period, stance, swing_peak, thigh_peak, impact = [], [], [], [], [], []
+        for segment in self.activities:
+            if segment.activity_type == ActivityType.STANDING:
+                continue
+            profile = ACTIVITY_PROFILES[segment.activity_type]
+            # cadence — шаги в минуту, цикл (stride) состоит из двух шагов
+            stride_time = 120.0 / (config.cadence * profile['cadence_scale'])
+            bout = segment.end_time - segment.start_time
+            n_max = int(bout / (stride_time * 0.5)) + 1
+            durations = stride_time * (1 + config.stride_cv * rng.standard_normal(n_max))
+            durations = np.clip(durations, 0.5 * stride_time, 1.5 * stride_time)
+            ends = np.cumsum(durations)
+            n = int(np.searchsorted(ends, bout, side='right'))
+            if n == 0:
+                continue
+            hs.append(segment.start_time + ends[:n] - durations[:n])
+            period.append(durations[:n])
+            stance.append(np.full(n, np.clip(config.stance_ratio + profile['stance_shift'], 0.2, 0.8)))
+            swing_peak.append(np.full(n, profile['swing_peak']))
+            thigh_peak.append(np.full(n, profile['thigh_peak']))
+            impact.append(np.full(n, profile['impact']))
+
+        def cat(parts):
+            return np.concatenate(parts) if parts else np.zeros(0)
+
+        self.hs_time = cat(hs)
+        self.period = cat(period)
+        self.stance = cat(stance)
+        self.swing_peak = cat(swing_peak)
+        self.thigh_peak = cat(thigh_peak)
+        self.impact = cat(impact)
+        # Отрицательная амплитуда опоры подобрана так, чтобы интеграл угловой скорости
+        # за цикл был нулевым: угол голени периодичен и не дрейфует на длинных записях
+        s = self.stance
+        self.stance_peak = (
+            self.swing_peak * (1 - s) * (0.25 + 1 / np.pi) / (2 * s / np.pi + (1 - s) / 4)
+        )
+
+    def _schedule(self, rng: np.random.Generator) -> List[ActivitySegment]:
+        config = self.config
+        weights = {a: w for a, w in config.activity_mix.items() if w > 0}
+        unsupported = [a for a in weights if a != ActivityType.STANDING and a not in ACTIVITY_PROFILES]
+        if unsupported:
+            raise ValueError(f"Synthetic generator does not support {', '.join(a.value for a in unsupported)}")
+        if not weights:
+            raise ValueError("activity_mix must contain at least one positive weight")
+
+        kinds = list(weights)
+        p = np.array([weights[a] for a in kinds], dtype=np.float64)
+        p /= p.sum()
+
+        segments = []
+        t = min(config.initial_standing, config.duration)
+        if t > 0:
+            segments.append(ActivitySegment(ActivityType.STANDING, 0.0, t, 1.0))
+        while t < config.duration:
+            length = config.bout_duration * rng.uniform(0.7, 1.3)
+            end = min(t + length, config.duration)
+            activity = kinds[rng.choice(len(kinds), p=p)]
+            if segments and segments[-1].activity_type == activity:
+                segments[-1].end_time = end
+            else:
+                segments.append(ActivitySegment(activity, t, end, 1.0))
+            t = end
+        return segments
+
+    def ground_truth(self) -> GaitGroundTruth:
+        fs = self.config.sampling_rate
+        to_time = self.hs_time + self.stance * self.period
+        ms_time = self.hs_time + (self.stance + (1 - self.stance) / 2) * self.period
+        next_hs_time = self.hs_time + self.period
+        as_idx = lambda t: np.round(t * fs).astype(np.int64)
+        return GaitGroundTruth(
+            hs_idx=as_idx(self.hs_time),
+            to_idx=as_idx(to_time),
+            ms_idx=as_idx(ms_time),
+            next_hs_idx=as_idx(next_hs_time),
+            activities=[
+                ActivitySegment(s.activity_type, s.start_time, s.end_time, s.confidence)
+                for s in self.activities
+            ]
+        )
+
+    def render(self, start: int, stop: int, rng: np.random.Generator) -> np.ndarray:
+        config = self.config
+        n = stop - start
+        t = np.arange(start, stop, dtype=np.float64) / config.sampling_rate
+
+        out = np.zeros(n, dtype=IMU_DTYPE)
+        out['timestamp'] = t
+
+        k = np.searchsorted(self.hs_time, t, side='right') - 1
+        kc = np.clip(k, 0, None)
+        if len(self.hs_time):
+            in_stride = (k >= 0) & (t < self.hs_time[kc] + self.period[kc])
+        else:
+            in_stride = np.zeros(n, dtype=bool)
+
+        shank_gyro = np.zeros(n)
+        shank_angle = np.zeros(n)
+        thigh_gyro = np.zeros(n)
+        thigh_angle = np.zeros(n)
+        impact = np.zeros(n)
+
+        if in_stride.any():
+            idx = kc[in_stride]
+            period = self.period[idx]
+            phase = (t[in_stride] - self.hs_time[idx]) / period
+            shank_gyro[in_stride], shank_angle[in_stride] = _shank_profile(
+                phase, self.stance[idx], self.swing_peak[idx], self.stance_peak[idx], period
+            )
+            thigh_gyro[in_stride], thigh_angle[in_stride] = _thigh_profile(
+                phase, self.stance[idx], self.thigh_peak[idx], period
+            )
+            # Затухающий удар по вертикали сразу после контакта пятки
+            tau = phase * period
+            impact[in_stride] = self.impact[idx] * np.exp(-tau / 0.03) * np.cos(2 * np.pi * 15 * tau)
+
+        for acc, gyro, angle, gyro_rate, shock in (
+            ('acc1', 'gyro1', thigh_angle, thigh_gyro, 0.4 * impact),
+            ('acc2', 'gyro2', shank_angle, shank_gyro, impact)
+        ):
+            pitch = np.deg2rad(angle)
+            out[acc][:, 0] = G * np.sin(pitch)
+            out[acc][:, 2] = -G * np.cos(pitch) - shock
+            out[acc] += rng.normal(0.0, config.acc_noise, (n, 3))
+
+            out[gyro][:, 1] = gyro_rate
+            out[gyro] += rng.normal(0.0, config.gyro_noise, (n, 3)) + config.gyro_bias
+        return out
+
+
+def _shank_profile(phase, stance, swing_peak, stance_peak, period) -> Tuple[np.ndarray, np.ndarray]:
+    # Опора: от нуля (HS) к минимуму -B в момент TO.
+    # Перенос: подъём до пика A в середине переноса и спад к нулю в следующем HS.
+    # Угол — аналитический интеграл скорости, за цикл возвращается в ноль.
+    A, B = swing_peak, stance_peak
+    stance_time = stance * period
+    swing_time = (1 - stance) * period
+
+    u = phase / stance
+    s = (phase - stance) / (1 - stance)
+    in_stance = phase < stance
+    rising = ~in_stance & (s < 0.5)
+
+    to_angle = -B * stance_time * 2 / np.pi
+    ms_angle = to_angle + swing_time * (A - B) / 4
+
+    gyro = np.where(
+        in_stance, -B * np.sin(np.pi * u / 2),
+        np.where(rising, -B + (A + B) * (1 - np.cos(2 * np.pi * s)) / 2, A * np.cos(np.pi * (s - 0.5)))
+    )
+    angle = np.where(
+        in_stance, -B * stance_time * 2 / np.pi * (1 - np.cos(np.pi * u / 2)),
+        np.where(
+            rising,
+            to_angle + swing_time * (-B * s + (A + B) / 2 * (s - np.sin(2 * np.pi * s) / (2 * np.pi))),
+            ms_angle + swing_time * A / np.pi * np.sin(np.pi * (s - 0.5))
+        )
+    )
+    return gyro, angle
+
+
+def _thigh_profile(phase, stance, thigh_peak, period) -> Tuple[np.ndarray, np.ndarray]:
+    # Максимальная скорость сгибания бедра приходится на начало переноса
+    arg = 2 * np.pi * (phase - stance) + np.pi / 2
+    arg0 = np.pi / 2 - 2 * np.pi * stance
+    gyro = thigh_peak * np.sin(arg)
+    angle = -thigh_peak * period / (2 * np.pi) * (np.cos(arg) - np.cos(arg0))
+    return gyro, angle
+
+
+def generate_recording(config: Optional[SyntheticGaitConfig] = None) -> Tuple[np.ndarray, GaitGroundTruth]:
+    config = config if config is not None else SyntheticGaitConfig()
+    plan = _StridePlan(config)
+    rng = np.random.default_rng(config.seed + 1)
+    n_samples = int(round(config.duration * config.sampling_rate))
+    data = np.empty(n_samples, dtype=IMU_DTYPE)
+    for start in range(0, n_samples, CHUNK_SAMPLES):
+        stop = min(start + CHUNK_SAMPLES, n_samples)
+        data[start:stop] = plan.render(start, stop, rng)
+    return data, plan.ground_truth()
+
+
+def write_recording(file_path, config: Optional[SyntheticGaitConfig] = None) -> GaitGroundTruth:
+    # Многочасовые записи пишутся блоками, в памяти держится только текущий блок
+    config = config if config is not None else SyntheticGaitConfig()
+    plan = _StridePlan(config)
+    rng = np.random.default_rng(config.seed + 1)
+    n_samples = int(round(config.duration * config.sampling_rate))
+    with open(file_path, 'wb') as f:
+        for start in range(0, n_samples, CHUNK_SAMPLES):
+            plan.render(start, min(start + CHUNK_SAMPLES, n_samples), rng).tofile(f)
+
+    truth = plan.ground_truth()
+    save_ground_truth(ground_truth_path(file_path), truth)
+    return truth
+
+
+def ground_truth_path(file_path) -> str:
+    return os.path.splitext(os.fspath(file_path))[0] + '.events.npz'
+
+
+def save_ground_truth(file_path, truth: GaitGroundTruth):
+    np.savez(
+        file_path,
+        hs_idx=truth.hs_idx,
+        to_idx=truth.to_idx,
+        ms_idx=truth.ms_idx,
+        next_hs_idx=truth.next_hs_idx,
+        activity=np.array([s.activity_type.value for s in truth.activities]),
+        activity_start=np.array([s.start_time for s in truth.activities]),
+        activity_end=np.array([s.end_time for s in truth.activities])
+    )
+
+
+def load_ground_truth(file_path) -> GaitGroundTruth:
+    with np.load(file_path) as f:
+        return GaitGroundTruth(
+            hs_idx=f['hs_idx'],
+            to_idx=f['to_idx'],
+            ms_idx=f['ms_idx'],
+            next_hs_idx=f['next_hs_idx'],
+            activities=[
+                ActivitySegment(ActivityType(a), float(s), float(e), 1.0)
+                for a, s, e in zip(f['activity'], f['activity_start'], f['activity_end'])
+            ]
+        )
+
+
+def match_events(detected: np.ndarray, truth: np.ndarray, tolerance: int) -> Dict[str, float]:
+    # Каждое истинное событие сопоставляется ближайшему найденному не дальше tolerance отсчётов
+    detected = np.unique(np.asarray(detected, dtype=np.int64))
+    truth = np.asarray(truth, dtype=np.int64)
+    if len(detected) == 0 or len(truth) == 0:
+        return {'precision': 0.0, 'recall': 0.0, 'f1': 0.0, 'mean_abs_error': float('nan'), 'matched': 0}
+
+    pos = np.searchsorted(detected, truth)
+    left = detected[np.clip(pos - 1, 0, len(detected) - 1)]
+    right = detected[np.clip(pos, 0, len(detected) - 1)]
+    nearest = np.where(np.abs(truth - left) <= np.abs(truth - right), left, right)
+    error = np.abs(truth - nearest)
+    hit = error <= tolerance
+
+    # Одно найденное событие засчитывается не более одного раза
+    matched = len(np.unique(nearest[hit]))
+    precision = matched / len(detected)
+    recall = matched / len(truth)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'mean_abs_error': float(np.mean(error[hit])) if hit.any() else float('nan'),
+        'matched': matched
+    }
+
+
+def score_cycles(
+    cycles: np.ndarray,
+    truth: GaitGroundTruth,
+    sampling_rate: int = 125,
+    tolerance: float = 0.05
+) -> Dict[str, Dict[str, float]]:
+    tol = int(round(tolerance * sampling_rate))
+    return {
+        'hs': match_events(cycles['hs_idx'], truth.hs_idx, tol),
+        'to': match_events(cycles['to_idx'], truth.to_idx, tol),
+        'ms': match_events(cycles['ms_idx'], truth.ms_idx, tol),
+    }
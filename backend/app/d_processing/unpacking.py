@@ -1,12 +1,171 @@
+import os
+import logging
 import numpy as np
-def unpack_bin(file_path):
-    dt = np.dtype([
-        ('header', 'u1'),
-        ('timestamp', 'f8'),
-        ('acc1',      'f4', (3,)), # x, y, z thigh 
-        ('gyro1',     'f4', (3,)), # x, y, z
-        ('acc2',      'f4', (3,)), # x, y, z shin
-        ('gyro2',     'f4', (3,))  # x, y, z
-    ])
-    data = np.fromfile(file_path, dtype=dt)
-    return data
\ No newline at end of file
+
+logger = logging.getLogger('Unpacking')
+
+IMU_DTYPE = np.dtype([
+    ('header', 'u1'),
+    ('timestamp', 'f8'),
+    ('acc1',      'f4', (3,)), # x, y, z thigh
+    ('gyro1',     'f4', (3,)), # x, y, z
+    ('acc2',      'f4', (3,)), # x, y, z shin
+    ('gyro2',     'f4', (3,))  # x, y, z
+])
+
+CHANNEL_FIELDS = ('acc1', 'gyro1', 'acc2', 'gyro2')
+N_CHANNELS = 3 * len(CHANNEL_FIELDS)
+CHANNEL_SLICES = {name: slice(3 * i, 3 * i + 3) for i, name in enumerate(CHANNEL_FIELDS)}
+
+ACC_LIMIT = 16 * 9.81     # м/с², диапазон ±16g
+GYRO_LIMIT = 2000.0       # град/с
+
+def record_count(n_bytes: int) -> int:
+    n_records, tail = divmod(n_bytes, IMU_DTYPE.itemsize)
+    if n_records == 0:
+        raise ValueError(f"Recording is shorter than one {IMU_DTYPE.itemsize}-byte record ({n_bytes} bytes)")
+    if tail:
+        logger.warning(f"Dropping trailing partial record: {tail} of {IMU_DTYPE.itemsize} bytes")
+    return n_records
+
+def unpack_buffer(buffer) -> np.ndarray:
+    view = memoryview(buffer).cast('B')
+    n_records = record_count(view.nbytes)
+    return np.frombuffer(view, dtype=IMU_DTYPE, count=n_records)
+
+def unpack_file(file_path, mmap: bool = True) -> np.ndarray:
+    n_records = record_count(os.path.getsize(file_path))
+    if mmap:
+        return np.memmap(file_path, dtype=IMU_DTYPE, mode='r', shape=(n_records,))
+    return np.fromfile(file_path, dtype=IMU_DTYPE, count=n_records)
+
+def unpack_bin(source, mmap: bool = True) -> np.ndarray:
+    if isinstance(source, (str, os.PathLike)):
+        return unpack_file(source, mmap=mmap)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return unpack_buffer(source)
+    raise TypeError(f"Cannot unpack recording from {type(source).__name__}")
+
+class ImuChannels:
+    # Каналы обоих датчиков одной C-непрерывной матрицей (N, 12), время — отдельным массивом.
+    # Доступ по имени поля ('acc1', 'timestamp', ...) и срезы работают как у записи IMU_DTYPE
+    __slots__ = ('signals', 'timestamp')
+
+    def __init__(self, signals: np.ndarray, timestamp: np.ndarray):
+        assert signals.ndim == 2 and signals.shape[1] == N_CHANNELS, f"signals должны иметь форму (N, {N_CHANNELS})"
+        assert len(timestamp) == len(signals), "signals и timestamp разной длины"
+        self.signals = signals
+        self.timestamp = timestamp
+
+    @classmethod
+    def empty(cls, n_samples: int, dtype=np.float32) -> 'ImuChannels':
+        return cls(np.empty((n_samples, N_CHANNELS), dtype=dtype), np.empty(n_samples, dtype=np.float64))
+
+    @classmethod
+    def from_records(cls, records: np.ndarray, dtype=np.float32, out: 'ImuChannels' = None) -> 'ImuChannels':
+        if out is None:
+            out = cls.empty(len(records), dtype)
+        for name in CHANNEL_FIELDS:
+            out[name] = records[name]
+        out.timestamp[...] = records['timestamp']
+        return out
+
+    @classmethod
+    def concatenate(cls, parts: list) -> 'ImuChannels':
+        return cls(
+            np.concatenate([p.signals for p in parts]),
+            np.concatenate([p.timestamp for p in parts])
+        )
+
+    def __len__(self) -> int:
+        return len(self.signals)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key == 'timestamp':
+                return self.timestamp
+            return self.signals[:, CHANNEL_SLICES[key]]
+        return ImuChannels(self.signals[key], self.timestamp[key])
+
+    def __setitem__(self, key: str, value):
+        self[key][...] = value
+
+    @property
+    def nbytes(self) -> int:
+        return self.signals.nbytes + self.timestamp.nbytes
+
+    def copy(self) -> 'ImuChannels':
+        return ImuChannels(self.signals.copy(), self.timestamp.copy())
+
+def validate_records(records: np.ndarray) -> dict:
+    timestamps = records['timestamp']
+    ts_valid = np.isfinite(timestamps)
+    ts_valid[1:] &= np.diff(timestamps) >= 0
+
+    def sensor_valid(acc: np.ndarray, gyro: np.ndarray) -> np.ndarray:
+        return (
+            np.all(np.abs(acc) <= ACC_LIMIT, axis=1) &
+            np.all(np.abs(gyro) <= GYRO_LIMIT, axis=1)
+        )
+
+    return {
+        'thigh': ts_valid & sensor_valid(records['acc1'], records['gyro1']),
+        'shin': ts_valid & sensor_valid(records['acc2'], records['gyro2'])
+    }
+
+class RecordSpool:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.n_bytes = 0
+        self.n_records = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        # Декодируются только первая и последняя целые записи: хранится начало потока
+        # и его последние 2 * itemsize байт, в которых последняя целая запись есть всегда
+        self._head = b''
+        self._last = b''
+        self._file = open(file_path, 'wb')
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.n_bytes += len(chunk)
+
+        itemsize = IMU_DTYPE.itemsize
+        if len(self._head) < itemsize:
+            self._head += chunk[:itemsize - len(self._head)]
+        self._last = (self._last + chunk[-2 * itemsize:])[-2 * itemsize:]
+
+        n_records, tail = divmod(self.n_bytes, itemsize)
+        if n_records == self.n_records:
+            return
+        if self.first_timestamp is None:
+            self.first_timestamp = float(np.frombuffer(self._head, dtype=IMU_DTYPE)['timestamp'][0])
+        end = len(self._last) - tail
+        self.last_timestamp = float(np.frombuffer(self._last[end - itemsize:end], dtype=IMU_DTYPE)['timestamp'][0])
+        self.n_records = n_records
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        tail = self.n_bytes % IMU_DTYPE.itemsize
+        if tail:
+            logger.warning(f"Spooled upload ends with a partial record: {tail} of {IMU_DTYPE.itemsize} bytes")
+
+    def records(self) -> np.ndarray:
+        self.close()
+        return unpack_file(self.file_path)
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
@@ -0,0 +1,118 @@
+import os
+import signal
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from .dclass import Metadata
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('ProcessingPool')
+
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", os.cpu_count() or 1))
+PROCESSING_JOB_TIMEOUT = float(os.getenv("PROCESSING_JOB_TIMEOUT", 1800))
+TIMEOUT_GRACE = 30.0
+
+
+class _JobTimeout(BaseException):
+    # BaseException, чтобы не быть перехваченным try/except стадий оркестратора
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _JobTimeout()
+
+
+def _init_worker():
+    # Прогрев: numpy/scipy и весь d_processing импортируются один раз на процесс
+    import numpy  # noqa: F401
+    import scipy.signal  # noqa: F401
+    from . import raw_process, session_pro  # noqa: F401
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+_workspace = None
+
+def _get_workspace():
+    # Одно рабочее пространство на процесс: буферы переживают задачи и переиспользуются
+    global _workspace
+    if _workspace is None:
+        from .workspace import Workspace
+        _workspace = Workspace()
+    return _workspace
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run_job(raw_data, metadata: Metadata, device_id: str, timeout: float, use_cache: bool = True):
+    from .raw_process import GaitAnalysisOrchestrator
+    from .instrumentation import StageInstrumentation, log_sink
+    from .caching import ResultCache, ArtifactCache, RESULT_CACHE_MAX_BYTES, ARTIFACT_CACHE_MAX_BYTES
+
+    orchestrator = GaitAnalysisOrchestrator(
+        instrumentation=StageInstrumentation(sink=log_sink),
+        result_cache=ResultCache() if use_cache and RESULT_CACHE_MAX_BYTES > 0 else None,
+        artifact_cache=ArtifactCache() if use_cache and ARTIFACT_CACHE_MAX_BYTES > 0 else None,
+        workspace=_get_workspace()
+    )
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return orchestrator.process_session(raw_data=raw_data, metadata=metadata, device_id=device_id)
+    except _JobTimeout:
+        raise TimeoutError(f"Processing exceeded {timeout:g}s")
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class ProcessingPool:
+    def __init__(self, workers: int = PROCESSING_WORKERS, timeout: float = PROCESSING_JOB_TIMEOUT, use_cache: bool = True):
+        self.workers = workers
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> 'ProcessingPool':
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+            for _ in range(self.workers):
+                self._executor.submit(_ping)
+            logger.info(f"Processing pool started with {self.workers} workers")
+        return self
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, raw_data, metadata: Metadata, device_id: str = "unknown_device"):
+        self.start()
+        return self._executor.submit(_run_job, raw_data, metadata, device_id, self.timeout, self.use_cache)
+
+    async def run(self, raw_data, metadata: Metadata, device_id: str = "unknown_device"):
+        future = asyncio.wrap_future(self.submit(raw_data, metadata, device_id))
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout + TIMEOUT_GRACE)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Processing worker did not answer within {self.timeout + TIMEOUT_GRACE:.0f}s")
+        except BrokenProcessPool:
+            logger.error("Processing pool is broken, restarting on next job")
+            self._executor = None
+            raise
+
+
+_pool: Optional[ProcessingPool] = None
+
+def get_pool() -> ProcessingPool:
+    global _pool
+    if _pool is None:
+        _pool = ProcessingPool()
+    return _pool.start()
@@ -0,0 +1,54 @@
+import os
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger('Workspace')
+
+# Буферы больше этого предела освобождаются после сессии, чтобы простаивающий
+# процесс не держал память под восьмичасовую запись
+WORKSPACE_MAX_RETAINED_BYTES = int(os.getenv("WORKSPACE_MAX_RETAINED_BYTES", 256 * 2**20))
+
+
+class Workspace:
+    # Именованные буферы, переиспользуемые между сессиями одного процесса.
+    # Буфер растёт под самую длинную запись; короче — отдаётся срез
+    def __init__(self, max_retained_bytes: int = WORKSPACE_MAX_RETAINED_BYTES):
+        self.max_retained_bytes = max_retained_bytes
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def get(self, name: str, shape, dtype) -> np.ndarray:
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        dtype = np.dtype(dtype)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.shape[1:] != shape[1:] or len(buffer) < shape[0]:
+            # Старый буфер отпускается до выделения нового, иначе на время роста их два
+            self._buffers.pop(name, None)
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer[:shape[0]]
+
+    def like(self, name: str, array: np.ndarray, dtype=None) -> np.ndarray:
+        return self.get(name, array.shape, array.dtype if dtype is None else dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._buffers.values())
+
+    def trim(self):
+        for name in [n for n, b in self._buffers.items() if b.nbytes > self.max_retained_bytes]:
+            logger.debug(f"Releasing workspace buffer {name}: {self._buffers[name].nbytes / 2**20:.0f} MiB")
+            del self._buffers[name]
+
+    def clear(self):
+        self._buffers.clear()
+
+
+def writable_copy(array: np.ndarray, workspace: Optional[Workspace], name: str) -> np.ndarray:
+    # Артефакты кэша открываются через memmap только на чтение
+    if workspace is None:
+        return np.array(array)
+    out = workspace.like(name, array)
+    out[...] = array
+    return out
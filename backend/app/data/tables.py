@@ -38,6 +38,12 @@ class SessionStatus(enum.Enum):
     PROCESSING = 'processing'
     COMPLETED = 'completed'
 
+class JobStatus(enum.Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
 class SideEnum(enum.Enum):
     LEFT = 'left'
     RIGHT = 'right'
@@ -332,6 +338,32 @@ class StepMetrics(Base):
     session = relationship("WalkingSessions", back_populates="step_metrics")
     device = relationship("Devices")
 
+class ProcessingJobs(Base):
+    __tablename__ = "processing_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(Integer, ForeignKey("walking_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    status = Column(SQLEnum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    raw_path = Column(String(500), nullable=False, comment="Путь к spool-файлу с сырыми данными")
+    device_id = Column(String(50), nullable=True)
+    session_meta = Column(JSON, nullable=False, comment="Поля Metadata для оркестратора")
+
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    next_run_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    session = relationship("WalkingSessions")
+
+    __table_args__ = (
+        Index('idx_processing_jobs_queue', 'status', 'next_run_at'),
+    )
+
 class Report(Base):
     __tablename__ = "reports"
 
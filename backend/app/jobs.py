@@ -0,0 +1,254 @@
+import os
+import shutil
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.data.tables import ProcessingJobs, JobStatus, WalkingSessions, SessionStatus
+from app.d_processing.dclass import Metadata
+from app.d_processing.detect_act import jsonb
+from app.d_processing.workers import PROCESSING_JOB_TIMEOUT, TIMEOUT_GRACE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('ProcessingJobs')
+
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", PROCESSING_JOB_TIMEOUT + TIMEOUT_GRACE + 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", 30))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", 3600))
+RAW_ARCHIVE_DIR = os.getenv("RAW_ARCHIVE_DIR", "storage/raw_archive")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(JOB_BACKOFF_BASE * 2 ** max(attempts - 1, 0), JOB_BACKOFF_MAX))
+
+
+def metadata_to_json(metadata: Metadata) -> Dict[str, Any]:
+    return {
+        'start_time': metadata.start_time.isoformat(),
+        'height': metadata.height,
+        'user_notes': metadata.user_notes,
+        'is_baseline': metadata.is_baseline,
+        'user_id': metadata.user_id,
+        'device_id': metadata.device_id,
+        'session_id': metadata.session_id
+    }
+
+
+def metadata_from_json(data: Dict[str, Any]) -> Metadata:
+    return Metadata(**{**data, 'start_time': datetime.fromisoformat(data['start_time'])})
+
+
+def _activity_json(activities) -> list:
+    # Сводка содержит ActivitySegment, в JSONB-колонку пишутся словари
+    if activities and not isinstance(activities[0], dict):
+        return jsonb(activities)
+    return list(activities)
+
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def summary_columns(summary: Dict[str, Any], metadata: Metadata) -> Dict[str, Any]:
+    return {
+        'start_time': metadata.start_time,
+        'end_time': _as_datetime(summary.get('end_time')),
+        'duration': summary.get('duration'),
+
+        'notes': metadata.user_notes,
+        'is_baseline': metadata.is_baseline,
+        'user_id': metadata.user_id,
+        'is_processed': True,
+        'status': SessionStatus.COMPLETED,
+        'activity_type': _activity_json(summary.get('activity_type', [])),
+
+        'step_count': int(summary.get('step_count', 0)),
+        'cadence': float(summary.get('cadence', 0)),
+        'avg_speed': float(summary.get('avg_speed', 0)),
+        'avg_peak_angular_velocity': summary.get('avg_peak_angular_velocity'),
+
+        # Joint Mechanics
+        'knee_angle_mean': summary.get('knee_angle_mean'),
+        'knee_angle_std': summary.get('knee_angle_std'),
+        'knee_angle_max': summary.get('knee_angle_max'),
+        'knee_angle_min': summary.get('knee_angle_min'),
+        'knee_amplitude': summary.get('knee_amplitude'),
+
+        'hip_angle_mean': summary.get('hip_angle_mean'),
+        'hip_angle_std': summary.get('hip_angle_std'),
+        'hip_angle_max': summary.get('hip_angle_max'),
+        'hip_angle_min': summary.get('hip_angle_min'),
+        'hip_amplitude': summary.get('hip_amplitude'),
+
+        'avg_roll': summary.get('avg_roll'),
+        'avg_pitch': summary.get('avg_pitch'),
+        'avg_yaw': summary.get('avg_yaw'),
+
+        # Variability
+        'gvi': summary.get('gvi'),
+        'step_time_variability': summary.get('step_time_cv'),
+        'stance_time_variability': summary.get('stance_time_cv'),
+        'swing_time_variability': summary.get('swing_time_cv'),
+        'knee_angle_variability': summary.get('knee_angle_cv'),
+        'stride_length_variability': summary.get('stride_length_variability'),
+
+        # Symmetry & Phases
+        'avg_stance_time': summary.get('avg_stance_time'),
+        'avg_swing_time': summary.get('avg_swing_time'),
+        'stance_swing_ratio': summary.get('stance_swing_ratio'),
+        'double_support_time': summary.get('double_support_time'),
+        'avg_impact_force': summary.get('avg_impact_force'),
+    }
+
+
+def apply_summary(session: WalkingSessions, summary: Dict[str, Any], metadata: Metadata):
+    for column, value in summary_columns(summary, metadata).items():
+        setattr(session, column, value)
+
+
+def raw_archive_path(session_id: int) -> Optional[str]:
+    if not RAW_ARCHIVE_DIR:
+        return None
+    return os.path.join(RAW_ARCHIVE_DIR, f"session_{session_id}.bin")
+
+
+def _remove_raw(job: ProcessingJobs):
+    if job.raw_path and os.path.exists(job.raw_path):
+        os.remove(job.raw_path)
+
+
+def _archive_raw(job: ProcessingJobs):
+    # Сырые данные сохраняются для пересчёта сессий после изменения алгоритмов
+    archive_path = raw_archive_path(job.session_id)
+    if archive_path is None or not (job.raw_path and os.path.exists(job.raw_path)):
+        _remove_raw(job)
+        return
+    os.makedirs(RAW_ARCHIVE_DIR, exist_ok=True)
+    shutil.move(job.raw_path, archive_path)
+
+
+def enqueue_job(
+    db: AsyncSession,
+    session_id: int,
+    raw_path: str,
+    metadata: Metadata,
+    device_id: Optional[str] = None
+) -> ProcessingJobs:
+    job = ProcessingJobs(
+        session_id=session_id,
+        status=JobStatus.QUEUED,
+        raw_path=raw_path,
+        device_id=device_id,
+        session_meta=metadata_to_json(metadata),
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        next_run_at=_now()
+    )
+    db.add(job)
+    return job
+
+
+async def claim_job(db: AsyncSession, worker_id: str) -> Optional[ProcessingJobs]:
+    result = await db.execute(
+        select(ProcessingJobs)
+        .where(ProcessingJobs.status == JobStatus.QUEUED, ProcessingJobs.next_run_at <= _now())
+        .order_by(ProcessingJobs.next_run_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = result.scalar_one_or_none()
+    if job is None:
+        await db.rollback()
+        return None
+
+    job.status = JobStatus.RUNNING
+    job.attempts += 1
+    job.lease_owner = worker_id
+    job.lease_expires_at = _now() + timedelta(seconds=JOB_LEASE_SECONDS)
+    await db.commit()
+    return job
+
+
+async def _owned_job(db: AsyncSession, job_id: int, worker_id: str) -> Optional[ProcessingJobs]:
+    result = await db.execute(
+        select(ProcessingJobs).where(ProcessingJobs.id == job_id).with_for_update()
+    )
+    job = result.scalar_one_or_none()
+    if job is None or job.status != JobStatus.RUNNING or job.lease_owner != worker_id:
+        # Аренду уже забрал reaper или другой воркер — результат не записываем
+        logger.warning(f"Job {job_id}: lease lost, dropping result")
+        await db.rollback()
+        return None
+    return job
+
+
+async def complete_job(db: AsyncSession, job_id: int, worker_id: str, summary: Dict[str, Any]):
+    job = await _owned_job(db, job_id, worker_id)
+    if job is None:
+        return
+
+    session = await db.get(WalkingSessions, job.session_id)
+    apply_summary(session, summary, metadata_from_json(job.session_meta))
+    job.status = JobStatus.SUCCEEDED
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.last_error = None
+    await db.commit()
+    _archive_raw(job)
+
+
+async def fail_job(db: AsyncSession, job_id: int, worker_id: str, error: str, retry: bool = True):
+    job = await _owned_job(db, job_id, worker_id)
+    if job is None:
+        return
+
+    job.last_error = error
+    job.lease_owner = None
+    job.lease_expires_at = None
+    if retry and job.attempts < job.max_attempts:
+        job.status = JobStatus.QUEUED
+        job.next_run_at = _now() + backoff_delay(job.attempts)
+        logger.warning(f"Job {job_id}: attempt {job.attempts} failed, retry at {job.next_run_at}: {error}")
+    else:
+        job.status = JobStatus.FAILED
+        session = await db.get(WalkingSessions, job.session_id)
+        session.status = SessionStatus.STOPPED
+        session.is_processed = False
+        logger.error(f"Job {job_id}: failed after {job.attempts} attempts: {error}")
+    await db.commit()
+    if job.status == JobStatus.FAILED:
+        _remove_raw(job)
+
+
+async def reap_expired_leases(db: AsyncSession) -> int:
+    result = await db.execute(
+        select(ProcessingJobs)
+        .where(ProcessingJobs.status == JobStatus.RUNNING, ProcessingJobs.lease_expires_at < _now())
+        .with_for_update(skip_locked=True)
+    )
+    expired = result.scalars().all()
+    for job in expired:
+        job.last_error = f"Lease of {job.lease_owner} expired"
+        job.lease_owner = None
+        job.lease_expires_at = None
+        if job.attempts < job.max_attempts:
+            job.status = JobStatus.QUEUED
+            job.next_run_at = _now() + backoff_delay(job.attempts)
+        else:
+            job.status = JobStatus.FAILED
+            session = await db.get(WalkingSessions, job.session_id)
+            session.status = SessionStatus.STOPPED
+    await db.commit()
+    for job in expired:
+        if job.status == JobStatus.FAILED:
+            _remove_raw(job)
+    if expired:
+        logger.warning(f"Requeued {len(expired)} job(s) with expired leases")
+    return len(expired)
@@ -1,13 +1,18 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, status, Request
 from typing import List
+import logging
+import numpy as np
 import uvicorn
 from datetime import datetime, timedelta
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from data.tables import init_database
 from routers import auth_r
-from schemas import IMUSample
+from d_processing.unpacking import unpack_buffer, validate_records
 from contextlib import asynccontextmanager 
+
+logger = logging.getLogger('Ingest')
+
 app = FastAPI(
     title="Gait Analysis API",
     version="1.0.0",
@@ -40,14 +45,38 @@ async def root():
 
 
 @app.post('/ingest', status_code=200)
-async def ingest(sample: List[IMUSample]):
-    if not sample:
+async def ingest(request: Request):
+    body = await request.body()
+    if not body:
         raise HTTPException(status_code=400, detail="Sample is empty")
+    try:
+        records = unpack_buffer(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    valid = validate_records(records)
+    # Длительность считается только по конечным меткам времени: NaN/inf не сериализуются в JSON
+    timestamps = records['timestamp'][np.isfinite(records['timestamp'])]
+    if len(timestamps) == 0:
+        raise HTTPException(status_code=400, detail="Sample has no finite timestamps")
+    stats = {}
+    for position, acc in (('thigh', 'acc1'), ('shin', 'acc2')):
+        mask = valid[position]
+        magnitude = np.linalg.norm(records[acc][mask], axis=1)
+        stats[position] = {
+            'count': int(np.count_nonzero(mask)),
+            'rejected': int(len(mask) - np.count_nonzero(mask)),
+            'acc_mean': float(magnitude.mean()) if len(magnitude) else 0.0,
+            'acc_max': float(magnitude.max()) if len(magnitude) else 0.0
+        }
+    logger.info(f"shin_count: {stats['shin']['count']}, thigh_count: {stats['thigh']['count']}")
 
-    thigh_count = sum(1 for s in sample if s.device_pos == 'thigh')
-    shin_count = sum(1 for s in sample if s.device_pos == 'shin')
-    print(f' shin_count: {shin_count}, thigh_count: {thigh_count}')
-    return {'received': len(sample), 'status' : 'success'}
+    return {
+        'received': len(records),
+        'duration': float(timestamps[-1] - timestamps[0]),
+        'positions': stats,
+        'status': 'success'
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy import select, update
+
+from app.data.tables import AsyncSessionLocal, WalkingSessions, ProcessingJobs, Profiles, SessionStatus
+from app.jobs import summary_columns, raw_archive_path
+from app.d_processing.dclass import Metadata
+from app.d_processing.unpacking import IMU_DTYPE
+from app.d_processing.workers import ProcessingPool, PROCESSING_WORKERS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('Reprocess')
+
+REPROCESS_CHECKPOINT = os.getenv("REPROCESS_CHECKPOINT", "storage/reprocess/checkpoint.json")
+REPROCESS_BATCH_SIZE = 50
+PROGRESS_INTERVAL = 10.0  # с
+DIFF_REL_TOLERANCE = 1e-3
+
+# Поля, которые берутся из самой сессии, а не считаются алгоритмом
+IDENTITY_COLUMNS = {'start_time', 'notes', 'is_baseline', 'user_id', 'is_processed', 'status'}
+
+
+@dataclass
+class ReprocessTarget:
+    session_id: int
+    raw_path: str
+    metadata: Metadata
+    device_id: str
+    n_samples: int
+    stored: Dict[str, Any]
+
+
+class Checkpoint:
+    def __init__(self, path: str, selection: Dict[str, Any]):
+        self.path = path
+        self.selection = selection
+        self.done: set = set()
+        self.failed: Dict[int, str] = {}
+
+    @classmethod
+    def load(cls, path: str, selection: Dict[str, Any]) -> 'Checkpoint':
+        checkpoint = cls(path, selection)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('selection') != selection:
+            raise ValueError(f"Checkpoint {path} belongs to a different selection: {data.get('selection')}")
+        checkpoint.done = set(data.get('done', []))
+        checkpoint.failed = {int(k): v for k, v in data.get('failed', {}).items()}
+        return checkpoint
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'selection': self.selection,
+                'updated_at': datetime.now().isoformat(),
+                'done': sorted(self.done),
+                'failed': {str(k): v for k, v in self.failed.items()}
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    def __init__(self, total: int, total_samples: int):
+        self.total = total
+        self.total_samples = total_samples
+        self.done = 0
+        self.failed = 0
+        self.samples = 0
+        self.started = time.monotonic()
+        self._last_report = 0.0
+
+    def update(self, target: ReprocessTarget, ok: bool):
+        self.done += 1
+        self.failed += 0 if ok else 1
+        self.samples += target.n_samples
+        now = time.monotonic()
+        if now - self._last_report >= PROGRESS_INTERVAL or self.done == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.samples / elapsed
+        remaining = (self.total_samples - self.samples) / rate if rate > 0 else float('inf')
+        logger.info(
+            f"{self.done}/{self.total} sessions ({self.failed} failed), "
+            f"{self.done / elapsed * 60:.1f} sessions/min, {rate:,.0f} samples/s, ETA {remaining:.0f}s"
+        )
+
+
+def _selection(args) -> Dict[str, Any]:
+    return {
+        'user_ids': sorted(args.user_id) if args.user_id else None,
+        'since': args.since.isoformat() if args.since else None,
+        'until': args.until.isoformat() if args.until else None,
+        'statuses': sorted(args.status) if args.status else None
+    }
+
+
+async def select_targets(selection: Dict[str, Any], limit: Optional[int] = None) -> List[ReprocessTarget]:
+    device_id = (
+        select(ProcessingJobs.device_id)
+        .where(ProcessingJobs.session_id == WalkingSessions.id)
+        .order_by(ProcessingJobs.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    query = (
+        select(WalkingSessions, Profiles.height, device_id)
+        .join(Profiles, Profiles.id == WalkingSessions.user_id)
+        .order_by(WalkingSessions.id)
+    )
+    if selection['user_ids']:
+        query = query.where(WalkingSessions.user_id.in_(selection['user_ids']))
+    if selection['since']:
+        query = query.where(WalkingSessions.start_time >= datetime.fromisoformat(selection['since']))
+    if selection['until']:
+        query = query.where(WalkingSessions.start_time < datetime.fromisoformat(selection['until']))
+    if selection['statuses']:
+        query = query.where(WalkingSessions.status.in_([SessionStatus(s) for s in selection['statuses']]))
+    if limit:
+        query = query.limit(limit)
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query)).all()
+
+    targets = []
+    missing = 0
+    for session, height, device in rows:
+        raw_path = raw_archive_path(session.id)
+        if raw_path is None or not os.path.exists(raw_path):
+            missing += 1
+            continue
+        metadata = Metadata(
+            start_time=session.start_time,
+            height=height,
+            user_notes=session.notes,
+            is_baseline=session.is_baseline,
+            user_id=session.user_id,
+            session_id=session.id
+        )
+        stored = {c.name: getattr(session, c.name) for c in WalkingSessions.__table__.columns}
+        targets.append(ReprocessTarget(
+            session_id=session.id,
+            raw_path=raw_path,
+            metadata=metadata,
+            device_id=device or "unknown_device",
+            n_samples=os.path.getsize(raw_path) // IMU_DTYPE.itemsize,
+            stored=stored
+        ))
+    if missing:
+        logger.warning(f"{missing} selected session(s) have no archived raw data and are skipped")
+    return targets
+
+
+def diff_summary(target: ReprocessTarget, columns: Dict[str, Any]) -> Dict[str, Any]:
+    changes = {}
+    for name, new in columns.items():
+        if name in IDENTITY_COLUMNS:
+            continue
+        old = target.stored.get(name)
+        if name == 'activity_type':
+            # Признаки окон пересчитываются с плавающей точкой, сравниваются только метки
+            old = [a.get('activity_type') for a in old or []]
+            new = [a.get('activity_type') for a in new or []]
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)) and not isinstance(old, bool):
+            if abs(new - old) <= DIFF_REL_TOLERANCE * max(abs(old), abs(new), 1e-9):
+                continue
+        elif old == new:
+            continue
+        changes[name] = {'old': old, 'new': new}
+    return changes
+
+
+async def write_batch(batch: List[tuple], checkpoint: Checkpoint):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(WalkingSessions),
+            [{'id': target.session_id, **columns} for target, columns in batch]
+        )
+        await db.commit()
+    checkpoint.done.update(target.session_id for target, _ in batch)
+    for target, _ in batch:
+        checkpoint.failed.pop(target.session_id, None)
+    checkpoint.save()
+
+
+async def reprocess(
+    targets: List[ReprocessTarget],
+    pool: ProcessingPool,
+    checkpoint: Optional[Checkpoint],
+    batch_size: int = REPROCESS_BATCH_SIZE,
+    dry_run: bool = False
+) -> Dict[int, Dict[str, Any]]:
+    progress = Progress(len(targets), sum(t.n_samples for t in targets))
+    slots = asyncio.Semaphore(pool.workers)
+    diffs = {}
+    batch = []
+
+    async def run_one(target: ReprocessTarget):
+        async with slots:
+            try:
+                summary = await pool.run(target.raw_path, target.metadata, device_id=target.device_id)
+            except Exception as e:
+                return target, None, f"{type(e).__name__}: {e}"
+        if isinstance(summary, str):
+            return target, None, f"Algorithm Error: {summary.strip()}"
+        if not summary:
+            return target, None, "No steps detected"
+        return target, summary, None
+
+    tasks = [asyncio.create_task(run_one(t)) for t in targets]
+    for next_done in asyncio.as_completed(tasks):
+        target, summary, error = await next_done
+        progress.update(target, ok=error is None)
+        if error is not None:
+            logger.warning(f"Session {target.session_id}: {error}")
+            if checkpoint is not None:
+                checkpoint.failed[target.session_id] = error
+            continue
+
+        columns = summary_columns(summary, target.metadata)
+        if dry_run:
+            changes = diff_summary(target, columns)
+            if changes:
+                diffs[target.session_id] = changes
+            continue
+
+        batch.append((target, columns))
+        if len(batch) >= batch_size:
+            await write_batch(batch, checkpoint)
+            batch = []
+
+    if batch:
+        await write_batch(batch, checkpoint)
+    elif checkpoint is not None and not dry_run:
+        checkpoint.save()
+    progress.report()
+    return diffs
+
+
+def _log_diffs(diffs: Dict[int, Dict[str, Any]]):
+    for session_id, changes in sorted(diffs.items()):
+        for name, change in changes.items():
+            old, new = change['old'], change['new']
+            if isinstance(old, (int, float)) and isinstance(new, (int, float)) and old:
+                logger.info(f"session {session_id}: {name} {old:.4g} -> {new:.4g} ({(new / old - 1) * 100:+.1f}%)")
+            else:
+                logger.info(f"session {session_id}: {name} {old!r} -> {new!r}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recompute summaries of stored walking sessions")
+    parser.add_argument('--user-id', type=int, action='append', help="may be given several times")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="start_time lower bound (inclusive)")
+    parser.add_argument('--until', type=datetime.fromisoformat, help="start_time upper bound (exclusive)")
+    parser.add_argument('--status', action='append', choices=[s.value for s in SessionStatus])
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--workers', type=int, default=PROCESSING_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=REPROCESS_BATCH_SIZE)
+    parser.add_argument('--checkpoint', default=REPROCESS_CHECKPOINT)
+    parser.add_argument('--restart', action='store_true', help="ignore the existing checkpoint")
+    parser.add_argument('--use-cache', action='store_true', help="allow result/artifact cache hits")
+    parser.add_argument('--dry-run', action='store_true', help="diff against stored values without writing")
+    parser.add_argument('--diff-out', help="write the dry-run diff to this JSON file")
+    args = parser.parse_args(argv)
+
+    selection = _selection(args)
+    checkpoint = None
+    if not args.dry_run:
+        try:
+            checkpoint = Checkpoint(args.checkpoint, selection) if args.restart else Checkpoint.load(args.checkpoint, selection)
+        except ValueError as e:
+            logger.error(f"{e}; use --restart or another --checkpoint")
+            return 2
+
+    async def run() -> Dict[int, Dict[str, Any]]:
+        targets = await select_targets(selection, args.limit)
+        if checkpoint is not None and checkpoint.done:
+            logger.info(f"Resuming: {len(checkpoint.done)} session(s) already done")
+            targets = [t for t in targets if t.session_id not in checkpoint.done]
+        logger.info(f"{len(targets)} session(s) to process on {args.workers} worker(s)")
+        if not targets:
+            return {}
+
+        # После изменения алгоритма кэш по умолчанию не используется: CACHE_VERSION могли не поднять
+        pool = ProcessingPool(workers=args.workers, use_cache=args.use_cache).start()
+        try:
+            return await reprocess(targets, pool, checkpoint, args.batch_size, args.dry_run)
+        finally:
+            pool.shutdown()
+
+    diffs = asyncio.run(run())
+    if args.dry_run:
+        _log_diffs(diffs)
+        logger.info(f"{len(diffs)} session(s) would change")
+        if args.diff_out:
+            with open(args.diff_out, 'w') as f:
+                json.dump({str(k): v for k, v in diffs.items()}, f, indent=2, default=str)
+    return 1 if checkpoint is not None and checkpoint.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
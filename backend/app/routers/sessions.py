@@ -1,6 +1,5 @@
 # routers/sessions_r.py
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from fastapi.concurrency import run_in_threadpool
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, insert
 from typing import List, Optional
@@ -16,13 +15,19 @@ from schemas import (
     RawDataUpload
 )
 from fastapi import UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 import numpy as np
 from sqlalchemy import update
 from sqlalchemy.orm import selectinload
-from d_processing.raw_process import GaitAnalysisOrchestrator
 from d_processing.dclass import Metadata as SessionMetadata
-from d_processing.step_metrics import calculate_step_metrics
-from d_processing.unpacking import unpack_bin
+from d_processing.unpacking import RecordSpool
+from jobs import enqueue_job
+import os
+import uuid
+import tempfile
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", tempfile.gettempdir())
 
 
 router = APIRouter(
@@ -184,7 +189,6 @@ async def get_all_sessions(
 @router.post("/{session_id}/upload",status_code=status.HTTP_200_OK)
 async def upload_session_data(
     session_id: int,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: Users = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
@@ -215,13 +219,16 @@ async def upload_session_data(
             detail="Session already has end_time. Cannot upload more data."
         )
     
+    spool_path = os.path.join(UPLOAD_SPOOL_DIR, f"session_{session_id}_{uuid.uuid4().hex}.bin")
     try:
-        bin_data = await file.read()
-        if len(bin_data) < 100:
+        with RecordSpool(spool_path) as spool:
+            # Запись на диск синхронная — уносим её из event loop
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(spool.write, chunk)
+        if spool.n_bytes < 100:
+            spool.discard()
             raise HTTPException(status_code=400, detail="File too small")
-        session.status = SessionStatus.PROCESSING
-        await db.commit()
-        
+
         user_res = await db.execute(
             select(Users).options(selectinload(Users.profile)).where(Users.id == current_user.id)
         )
@@ -237,15 +244,7 @@ async def upload_session_data(
             session_id=session.id
         )
         session.status = SessionStatus.PROCESSING
-       
-        db_url = str(db.get_bind().url)
-    
-        background_tasks.add_task(
-           process_session_data,
-           session_id,
-           bin_data,
-           meta,
-           db_url)
+        enqueue_job(db, session_id, spool_path, meta, device_id=meta.device_id)
 
         await db.commit()
         await db.refresh(session)
@@ -255,102 +254,13 @@ async def upload_session_data(
            "session_id": session_id
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         await db.rollback()
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error on uploading data: {str(e)}"
+            detail=f"Error on uploading data: {str(e)}"
         )
-
-async def process_session_data(session: WalkingSessions, raw_data, metadata: SessionMetadata, db_url: str):
-    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-    
-    engine = create_async_engine(db_url)
-    session_factory = async_sessionmaker(engine, expire_on_commit=False)
-
-    orchestrator = GaitAnalysisOrchestrator(
-        unpack_bin=unpack_bin,
-        calculate_step_metrics=calculate_step_metrics)
-    from d_processing import session_pro
-    orchestrator.session = session_pro
-    
-    async with session_factory() as db:
-        try:
-            res = await db.execute(select(WalkingSessions).where(WalkingSessions.id == session_id))
-            session = res.scalar_one()
-            summary = await run_in_threadpool(
-                orchestrator.process_session,
-                raw_data=raw_data,
-                metadata=metadata
-            )
-        
-            if isinstance(summary, str): 
-                print(f"Algorithm Error: {summary}")
-                session.status = SessionStatus.STOPPED
-                session.is_processed = False
-                return
-
-            if not summary:
-                session.status = SessionStatus.STOPPED
-                return
-
-            
-            session.start_time = metadata.start_time
-            session.end_time = summary.get('end_time')
-            session.duration = summary.get('duration')
-
-            session.user_notes = metadata.user_notes
-            session.is_baseline = metadata.is_baseline
-            session.user_id = metadata.user_id
-            session.is_processed = True
-            session.status = SessionStatus.COMPLETED.value
-            session.activity_type = summary.get('activity_type', [])
-
-            session.step_count = int(summary.get('step_count', 0))
-            session.cadence = float(summary.get('cadence', 0))
-            session.avg_speed = float(summary.get('avg_speed', 0))
-            session.avg_peak_angular_velocity = summary.get('avg_peak_angular_velocity')
-        
-            # Joint Mechanics
-            session.knee_angle_mean = summary.get('knee_angle_mean')
-            session.knee_angle_std = summary.get('knee_angle_std')
-            session.knee_angle_max = summary.get('knee_angle_max')
-            session.knee_angle_min = summary.get('knee_angle_min')
-            session.knee_amplitude = summary.get('knee_amplitude')
-        
-            session.hip_angle_mean = summary.get('hip_angle_mean')
-            session.hip_angle_std = summary.get('hip_angle_std')
-            session.hip_angle_max = summary.get('hip_angle_max')
-            session.hip_angle_min = summary.get('hip_angle_min')
-            session.hip_amplitude = summary.get('hip_amplitude')
-        
-            session.avg_roll = summary.get('avg_roll')
-            session.avg_pitch = summary.get('avg_pitch')
-            session.avg_yaw = summary.get('avg_yaw')
-        
-            # Variability
-            session.gvi = summary.get('gvi')
-            session.step_time_variability = summary.get('step_time_cv')
-            session.stance_time_variability = summary.get('stance_time_cv')
-            session.swing_time_variability = summary.get('swing_time_cv')
-            session.knee_angle_variability = summary.get('knee_angle_cv')
-            session.stride_length_variability = summary.get('stride_length_variability')
-
-            # Symmetry & Phases
-            session.avg_stance_time = summary.get('avg_stance_time')
-            session.avg_swing_time = summary.get('avg_swing_time')
-            session.stance_swing_ratio = summary.get('stance_swing_ratio')
-            session.double_support_time = summary.get('double_support_time')
-            session.avg_impact_force = summary.get('avg_impact_force')
-
-            await db.commit()
-        
-        except Exception as e:
-            print(f"Wrapper Error: {str(e)}")
-            import traceback 
-            traceback.print_exc()
-            session.status = SessionStatus.STOPPED
-            session.is_processed = False
-            await db.rollback()
-        finally:
-            await engine.dispose()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import socket
+import asyncio
+import logging
+
+from app.data.tables import AsyncSessionLocal
+from app.jobs import claim_job, complete_job, fail_job, reap_expired_leases, metadata_from_json
+from app.d_processing.workers import ProcessingPool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('Worker')
+
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2.0))
+REAP_INTERVAL = float(os.getenv("JOB_REAP_INTERVAL", 60.0))
+
+
+async def handle_job(pool: ProcessingPool, job, worker_id: str):
+    metadata = metadata_from_json(job.session_meta)
+    try:
+        summary = await pool.run(job.raw_path, metadata, device_id=job.device_id or "unknown_device")
+    except Exception as e:
+        async with AsyncSessionLocal() as db:
+            await fail_job(db, job.id, worker_id, f"{type(e).__name__}: {e}", retry=True)
+        return
+
+    async with AsyncSessionLocal() as db:
+        if isinstance(summary, str):
+            # Ошибка алгоритма детерминирована — повтор не поможет
+            await fail_job(db, job.id, worker_id, f"Algorithm Error: {summary}", retry=False)
+        elif not summary:
+            await fail_job(db, job.id, worker_id, "No steps detected", retry=False)
+        else:
+            await complete_job(db, job.id, worker_id, summary)
+            logger.info(f"Job {job.id}: session {job.session_id} processed")
+
+
+async def reaper_loop():
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await reap_expired_leases(db)
+        except Exception as e:
+            logger.error(f"Reaper error: {e}")
+        await asyncio.sleep(REAP_INTERVAL)
+
+
+async def run_worker(pool: ProcessingPool, worker_id: str):
+    slots = asyncio.Semaphore(pool.workers)
+    running = set()
+    reaper = asyncio.create_task(reaper_loop())
+    logger.info(f"Worker {worker_id} polling for jobs")
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await claim_job(db, worker_id)
+            except Exception as e:
+                logger.error(f"Claim error: {e}")
+                job = None
+            if job is None:
+                slots.release()
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            task = asyncio.create_task(handle_job(pool, job, worker_id))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+    finally:
+        reaper.cancel()
+        pool.shutdown()
+
+
+def main():
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    pool = ProcessingPool().start()
+    asyncio.run(run_worker(pool, worker_id))
+
+
+if __name__ == "__main__":
+    main()